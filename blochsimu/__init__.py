@@ -24,7 +24,7 @@ throughout the experiment :
         'z0': 1.0,
         'I' : 0,
         'Q' : 0,
-        'd' : lambda t: 0,
+        'd' : 0,
         'G1': 1 / 85e-6,
         'G2': 1 / 120e-6,
     }
@@ -54,6 +54,20 @@ Then, we can numerically solve it by `bs.blochsolve` :
 
     u_sol, u_sol_section = bs.blochsolve(expe, dt=5e-7)
 
+To sample all sections on one global time grid, without duplicating the
+section boundaries in u_sol, and sample the sections with constant physical
+arguments by their exact propagators :
+
+    u_sol, u_sol_section = bs.blochsolve(expe, dt=5e-7, grid='global')
+
+When some sections are stiff, e.g. a reset with large G1 and G2, let
+`bs.blochsolve` choose the method of each section by its stiffness, and
+report the choices :
+
+    u_sol, u_sol_section, info = bs.blochsolve(
+        expe, dt=5e-7, method='auto', full_output=True)
+    print(info['method'], info['stiffness'])
+
 By `bs.blochdrawer`, we can animate it or simply plot the result :
 
     bs.blochdrawer.plot(u_sol, block=False)
@@ -67,6 +81,13 @@ Which is commonly used in the experiment of superconducting qubits.
     print(pi_pulse(t=10e-8))
     print(pi_pulse(np.linspace(0, 10e-8, 5)))
 
+Callable physical arguments are evaluated one time at a time by the
+integrator. `ExpScheme.precompile` samples each of them once per section on
+an adaptive grid and replaces it by a `bs.InterpolationTable`, which is then
+used by both `bs.blochsolve` and `ExpScheme.plot_phy_arg` :
+
+    errors = expe.precompile(tol=1e-6, kind='cubic')
+
 The `draw_bloch_sphere` function returns an figure and axes with a bloch 
 sphere drawn on it.
 
@@ -74,12 +95,128 @@ sphere drawn on it.
     ax.plot(0.5, 0.5, 0.5, 'r o')
     plt.show()
 
+Both `bs.blochdrawer` and `draw_bloch_sphere` use the global state of pyplot.
+To render in parallel threads or processes, e.g. for reports, use the
+stateless functions of module `render`, which take and return explicit figure
+and axes, and create `matplotlib.figure.Figure` without pyplot :
+
+    fig, ax = bs.render.plot_trajectory(u_sol)
+    fig, ax = bs.render.plot_phy_arg(expe, 'I', dt=5e-7)
+    fig.savefig('pulse_I.png')
+
+To simulate a drive at the actual qubit frequency, provide the carrier
+angular frequency, then I and Q are the envelope of the drive and d is the
+detune from the carrier. The solution is in the rotating frame, transform it
+back to the lab frame on demand :
+
+    expe = bs.ExpScheme(**phy_args, carrier=2*np.pi*5e+9)
+    u_sol, u_sol_section = bs.blochsolve(expe, dt=5e-7)
+    u_lab = bs.to_lab_frame(u_sol, expe.carrier)
+
+To optimize a pulse shape, give the drive as `bs.PiecewiseConstant` samples,
+then `bs.grape` maximizes the overlap of the final position with a target by
+exact gradients, updating the samples in place :
+
+    pulse = bs.PiecewiseConstant(np.full(50, 1e+5), 10e-6)
+    expe.sequence = (bs.Section(10e-6, I=pulse),)
+    result = bs.grape(expe, (0, 0, -1), bounds=(-1e+6, 1e+6))
+
+To repeat an experiment over many values, e.g. the waiting time of a Ramsey
+experiment, `bs.sweep` returns the final position for each value. Sections
+with constant physical arguments are solved exactly in a batch :
+
+    def ramsey(tau):
+        expe = bs.ExpScheme(**phy_args)
+        expe.sequence = (
+            bs.Section(17e-6, I=1e+5),
+            bs.Section(tau),
+            bs.Section(17e-6, I=1e+5),
+        )
+        return expe
+    taus = np.linspace(1e-6, 400e-6, 201)
+    u_end = bs.sweep(ramsey, taus, dt=5e-7)
+
+Long sequences drawn from a small gate set repeat the same sections and
+blocks. `ExpScheme.compile` finds them, computes each unique propagator once
+and composes them into the final position :
+
+    compiled = expe.compile()
+    u_end = compiled.final_state()
+    print(compiled.stats['dedup_ratio'])
+
+For randomized benchmarking, `bs.CliffordRB` precomputes the propagators of
+the 24 Clifford gates, with the decay of the template scheme, and applies
+random sequences of all lengths in a batch :
+
+    rb = bs.CliffordRB(expe, amplitude=2*np.pi*10e+6)
+    survival = rb.survival(lengths, n_seq=200, seed=1234)
+    A, p, B = bs.fit_rb_decay(lengths, survival.mean(axis=1))
+
+For a 2-D map, e.g. a Rabi chevron, `bs.map_sweep` solves every pair of
+values, in chunks that cap the memory :
+
+    def rabi(d, s):
+        expe = bs.ExpScheme(**phy_args)
+        expe.sequence = (bs.Section(s, I=1e+5, d=d),)
+        return expe
+    u_end = bs.map_sweep(rabi, detunes, durations, dt=5e-7)  # (n0, n1, 3)
+
+The same callable is a template to fit measured data, the parameters to be
+fitted are given by the initial guess :
+
+    result = bs.fit_bloch(ramsey, taus, z_measured, {'G2': 1e+4, 'd': 1e+5})
+    print(result.params)
+
+To compare with single-shot experiments, `bs.sample_shots` samples the number
+of outcome |1> among the shots for every final position, with an optional
+assignment matrix and state preparation error :
+
+    counts = bs.sample_shots(u_end, shots=10000, seed=1234,
+                             assignment=[[0.97, 0.05], [0.03, 0.95]])
+
+In asyncio code, `bs.ablochsolve` and `bs.asweep` solve in an executor
+without blocking the event loop, sweep results are yielded as completed :
+
+    u_sol, u_sol_section = await bs.ablochsolve(expe, dt=5e-7, timeout=60)
+    async for index, u_end in bs.asweep(ramsey, taus, dt=5e-7):
+        print(taus[index], u_end)
+
+Use `bs.AsyncSolver` to set the executor and the concurrency limit.
+
+Experiment schemes are pickled to other processes, or serialized to JSON by
+module `serialize`, as long as every physical argument is a number or a wave
+form of module `waveform` (not a lambda). `bs.content_hash` gives a stable
+hash of what an experiment scheme solves :
+
+    text = bs.serialize.dumps(expe)
+    expe = bs.serialize.loads(text)
+    key = bs.content_hash(expe)
+
+Pass a `bs.ResultCache` to `bs.blochsolve` or `bs.sweep` to store solutions
+on disk, solving the same experiment scheme again loads it instead :
+
+    cache = bs.ResultCache('.blochsimu_cache')
+    u_sol, u_sol_section = bs.blochsolve(expe, dt=5e-7, cache=cache)
+
+Long sweeps are run from the command line by a job file, which describes the
+experiment scheme and the swept values, see module `cli`. Completed chunks are
+saved to the output directory, a killed job resumes from them :
+
+    python -m blochsimu run ramsey_job.toml --workers 4
+
 For more detail, see docstring for each class method.
 
 Classes
 ----------
   * ExpScheme -- An experiment setup scheme.
   * Section -- A section with customized physical argument and duration.
+  * AsyncSolver -- Solve in an executor with bounded concurrency.
+  * ResultCache -- A disk cache of solutions keyed by content hash.
+  * CompiledScheme -- A scheme compiled into unique sections and blocks.
+  * CliffordRB -- Simulate randomized benchmarking of Clifford gates.
+  * GaussianPaddedPulse -- A pulse wave with gaussian padding.
+  * PiecewiseConstant -- A wave form that holds each sample for a slice.
+  * InterpolationTable -- A wave form interpolated from adaptive samples.
 
 Class instance
 ----------
@@ -89,10 +226,40 @@ Functions
 ----------
   * blochsolve -- numerically solve a given experiment scheme.
   * gaussian_padded_pulse -- Make a pulse wave with gaussian padding.
+  * tabulate -- sample a wave form into an adaptive interpolation table.
   * draw_bloch_sphere -- create a figre and axes with bloch sphere drawn.
+  * to_lab_frame -- transform a rotating frame solution to the lab frame.
+  * to_rotating_frame -- transform a lab frame solution to rotating frame.
+  * grape_gradient -- exact gradient of an objective to the pulse samples.
+  * grape -- optimize the pulse samples to maximize an objective.
+  * final_states -- exactly solve final positions of schemes in a batch.
+  * sweep -- solve the final positions of an experiment swept over values.
+  * map_sweep -- solve the final positions of an experiment over a 2-D map.
+  * compile_scheme -- compile a scheme to reuse repeated propagators.
+  * fit_rb_decay -- fit the survival probability by A p^m + B.
+  * fit_bloch -- fit measured data by a bloch simulation model.
+  * fit_bloch_many -- fit the measured data of many qubits in parallel.
+  * measurement_probability -- the probability to read outcome 1.
+  * sample_shots -- sample the number of outcome 1 among the shots.
+  * ablochsolve -- solve an experiment scheme without blocking event loop.
+  * asweep -- solve a sweep asynchronously, yield results as completed.
+  * content_hash -- a stable hash of what an experiment scheme solves.
 """
 
 from .expscheme import Section, ExpScheme
 from .blochnumint import blochsolve
 from .blochdraw import blochdrawer, draw_bloch_sphere
-from .waveform import gaussian_padded_pulse
+from . import render
+from .waveform import (gaussian_padded_pulse, GaussianPaddedPulse,
+                       PiecewiseConstant, InterpolationTable, tabulate)
+from .rotframe import to_lab_frame, to_rotating_frame
+from .grape import grape_gradient, grape
+from .sweep import final_states, sweep, map_sweep
+from .fitting import fit_bloch, fit_bloch_many
+from .readout import measurement_probability, sample_shots
+from .asyncsolve import AsyncSolver, ablochsolve, asweep
+from . import serialize
+from .serialize import content_hash
+from .cache import ResultCache
+from .seqcompile import CompiledScheme, compile_scheme
+from .rb import CliffordRB, fit_rb_decay
@@ -0,0 +1,276 @@
+# -*- coding: utf-8 -*-
+"""Solve experiment schemes from asyncio code without blocking the event loop.
+
+Solving an experiment scheme takes from milliseconds to minutes, calling
+`blochsolve` inside a coroutine would block the event loop for that long. The
+class `AsyncSolver` offloads the work to an executor, a thread pool by default
+or a process pool, and limits the number of concurrent jobs, such that a busy
+service queues the jobs instead of overloading the executor.
+
+    solver = bs.AsyncSolver(max_concurrency=4, timeout=60)
+    u_sol, u_sol_section = await solver.blochsolve(expe, dt=5e-7)
+    async for index, u_end in solver.sweep(ramsey, taus, dt=5e-7):
+        print(taus[index], u_end)
+
+Sweep results are yielded as soon as each value is solved, in the order of
+completion. On timeout or cancellation, a job running in a thread stops
+before its next section, a job in a process pool stops only if it has not
+started, since the cancellation can not be shared with other processes.
+Either way, the job keeps its slot of the concurrency limit until it stops.
+
+The functions `ablochsolve` and `asweep` use a shared `AsyncSolver` with the
+default executor of the event loop.
+
+Class
+----------
+AsyncSolver
+
+function
+----------
+ablochsolve
+asweep
+"""
+
+import asyncio
+import functools
+import threading
+import weakref
+import numpy as np
+from concurrent.futures import Executor, ProcessPoolExecutor
+from .expscheme import ExpScheme
+from .blochnumint import blochsolve
+from .sweep import _is_constant, final_states
+from typing import AsyncIterator, Callable, Iterable, Tuple
+__all__ = [
+    'AsyncSolver',
+    'ablochsolve',
+    'asweep'
+]
+
+def _solve_end(expe: ExpScheme, dt: float,
+               cancel: threading.Event = None) -> np.ndarray:
+    """Return the final position (x, y, z) of an experiment scheme."""
+    if _is_constant(expe):
+        return final_states([expe])[0]
+    return blochsolve(expe, dt, cancel=cancel)[0][1:4, -1]
+
+class AsyncSolver:
+    """Solve experiment schemes in an executor with bounded concurrency.
+
+    Instance variables
+    ----------
+    executor : concurrent.futures.Executor or None
+        The executor to run the jobs, None is the default executor of
+        the event loop.
+    max_concurrency : int
+        The maximum number of jobs running at the same time.
+    timeout : float or None
+        The default timeout of each job, in seconds.
+
+    Public methods
+    ----------
+    blochsolve -- solve an experiment scheme.
+    sweep -- solve an experiment swept over values, yield as completed.
+    """
+
+    def __init__(self, executor: Executor = None,
+                 *,
+                 max_concurrency: int = 4,
+                 timeout: float = None) -> None:
+        """Set the executor, the concurrency limit and the default timeout.
+
+        Argument
+        ----------
+        executor : concurrent.futures.Executor, optional
+            A thread pool or a process pool to run the jobs. (default is
+            None, the default executor of the event loop)
+
+        Keyword Arguments
+        ----------
+        max_concurrency : int, optional
+            The maximum number of jobs running at the same time, further
+            jobs wait for a free slot. (default is 4)
+        timeout : float, optional
+            The default timeout of each job, in seconds. (default is None,
+            no timeout)
+        """
+        if max_concurrency < 1:
+            raise ValueError(
+                'The max_concurrency should be at least 1.') from None
+        self.executor = executor
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        # one semaphore for each running event loop
+        self._semaphores = weakref.WeakKeyDictionary()
+
+    async def _run(self, function: Callable, *args, timeout: float = None):
+        """Run function(*args, cancel=...) in the executor, wait for it."""
+        loop = asyncio.get_running_loop()
+        if loop not in self._semaphores:
+            self._semaphores[loop] = asyncio.Semaphore(self.max_concurrency)
+        semaphore = self._semaphores[loop]
+        cancel = None
+        if not isinstance(self.executor, ProcessPoolExecutor):
+            cancel = threading.Event()
+        job = functools.partial(function, *args, cancel=cancel)
+        await semaphore.acquire()
+        try:
+            if self.executor is None:
+                job_future = None
+                future = loop.run_in_executor(None, job)
+            else:
+                job_future = self.executor.submit(job)
+                future = asyncio.wrap_future(job_future)
+        except BaseException:
+            semaphore.release()
+            raise
+
+        # the slot is held until the job stops, not until the wait stops
+        def release(future):
+            semaphore.release()
+            if not future.cancelled():
+                future.exception() # nobody may wait for it anymore
+        future.add_done_callback(release)
+        try:
+            return await asyncio.wait_for(
+                asyncio.shield(future),
+                self.timeout if timeout is None else timeout)
+        finally:
+            if cancel is not None:
+                cancel.set()
+            if job_future is not None:
+                job_future.cancel() # only if it has not started
+
+    async def blochsolve(self, expe: ExpScheme, dt: float,
+                         *,
+                         timeout: float = None) -> Tuple[np.ndarray]:
+        '''
+        Solve an experiment scheme in the executor, see `blochsolve`.
+
+        Arguments
+        ----------
+        expe : ExpScheme object
+            The experiment scheme.
+        dt : float
+            The time interval for sampling in numerical integration.
+
+        Keyword Argument
+        ----------
+        timeout : float, optional
+            The timeout in seconds, raise `asyncio.TimeoutError` when it is
+            exceeded. (default is None, use self.timeout)
+
+        Returns
+        ----------
+        u_sol, u_sol_sections :
+            The solution, see `blochsolve`.
+        '''
+        return await self._run(blochsolve, expe, dt, timeout=timeout)
+
+    async def sweep(self, scheme_of: Callable[[float], ExpScheme],
+                    values: Iterable,
+                    dt: float,
+                    *,
+                    timeout: float = None
+                    ) -> AsyncIterator[Tuple[int, np.ndarray]]:
+        '''
+        Solve an experiment swept over values, yield results as completed.
+
+        The values are consumed lazily, at most max_concurrency experiment
+        schemes are built and waiting for the results at the same time.
+        scheme_of is called in the event loop thread, so it should be
+        quick, building the scheme and not solving it.
+
+        Arguments
+        ----------
+        scheme_of : callable(value)
+            Return the experiment scheme for a value.
+        values : iterable
+            The values to be swept.
+        dt : float
+            The time interval for sampling in numerical integration.
+
+        Keyword Argument
+        ----------
+        timeout : float, optional
+            The timeout of each value in seconds. (default is None, use
+            self.timeout)
+
+        Yields
+        ----------
+        index : int
+            The index of the value.
+        u_end : numpy.ndarray with shape (3,)
+            The final position (x, y, z) for the value.
+        '''
+        async def solve(index, expe):
+            return index, await self._run(_solve_end, expe, dt, timeout=timeout)
+
+        values = enumerate(values)
+        pending = set()
+        exhausted = False
+        try:
+            while True:
+                while not exhausted and len(pending) < self.max_concurrency:
+                    try:
+                        index, value = next(values)
+                    except StopIteration:
+                        exhausted = True
+                        break
+                    pending.add(asyncio.ensure_future(
+                        solve(index, scheme_of(value))))
+                if len(pending) == 0:
+                    return
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    yield task.result()
+        finally:
+            for task in pending:
+                task.cancel()
+
+_default_solver = None
+
+def _get_default_solver() -> AsyncSolver:
+    """Return the shared solver, create it at the first use."""
+    global _default_solver
+    if _default_solver is None:
+        _default_solver = AsyncSolver()
+    return _default_solver
+
+async def ablochsolve(expe: ExpScheme, dt: float,
+                      *,
+                      timeout: float = None) -> Tuple[np.ndarray]:
+    '''
+    Solve an experiment scheme without blocking the event loop.
+
+    Arguments
+    ----------
+    expe : ExpScheme object
+        The experiment scheme.
+    dt : float
+        The time interval for sampling in numerical integration.
+
+    Keyword Argument
+    ----------
+    timeout : float, optional
+        The timeout in seconds. (default is None, no timeout)
+
+    Returns
+    ----------
+    u_sol, u_sol_sections :
+        The solution, see `blochsolve`.
+    '''
+    return await _get_default_solver().blochsolve(expe, dt, timeout=timeout)
+
+def asweep(scheme_of: Callable[[float], ExpScheme],
+           values: Iterable,
+           dt: float,
+           *,
+           timeout: float = None) -> AsyncIterator[Tuple[int, np.ndarray]]:
+    '''
+    Solve an experiment swept over values, yield (index, u_end) as completed.
+
+    See `AsyncSolver.sweep`, this uses a shared `AsyncSolver`.
+    '''
+    return _get_default_solver().sweep(scheme_of, values, dt, timeout=timeout)
@@ -17,6 +17,9 @@ self.ax to costimize the plot.
 `draw_bloch_sphere` create an figure with bloch sphere drawn on it and return
 its figure and axes, user can make use of it to plot anything as desired.
 
+Both create pyplot figures to be shown, they draw by the stateless functions
+of module `render`, which are safe to use in parallel threads or processes.
+
 
 Class
 ----------
@@ -32,8 +35,7 @@ draw_bloch_sphere
 """
 import numpy as np
 import matplotlib.pyplot as plt
-import matplotlib.animation
-import matplotlib.axes
+from .render import draw_sphere, plot_trajectory, animate_trajectory
 
 __all__ = [
     'BlochSphereDarwer',
@@ -60,33 +62,7 @@ def draw_bloch_sphere(figure_title: str) -> tuple:
     # creat figure and axes
     fig = plt.figure(figure_title)
     ax = fig.add_subplot(111, projection = '3d')
-    ax.set(title = 'Qubit on bloch sphere')
-    ax.set(xlim3d=(-1.1, 1.1), ylim3d=(-1.1, 1.1),
-                zlim3d=(-1.1, 1.1))
-    # plot spherical coordinate curves
-    u, v = np.mgrid[0 : 2*np.pi : 200j, 0 : np.pi : 100j]
-    x = np.cos(u) * np.sin(v)
-    y = np.sin(u) * np.sin(v)
-    z = np.cos(v)
-    ax.plot_wireframe(x, y, z, rstride=18, cstride=18, linewidth=1, color='tan')
-    # add axis and labeling
-    ax.quiver(-1.3,  0,  0, 2.6, 0, 0, color = 'k', arrow_length_ratio = 0.05) # x-axis
-    ax.quiver( 0, -1.3,  0, 0, 2.6, 0, color = 'k', arrow_length_ratio = 0.05) # y-axis
-    ax.quiver( 0,  0, -1.3, 0, 0, 2.6, color = 'k', arrow_length_ratio = 0.05) # z-axis
-    ax.text( 1.5, 0, 0, '$x$',
-            color='k', fontweight=100, fontsize=15,
-            horizontalalignment='center', verticalalignment='center')
-    ax.text( 0, 1.5, 0, '$y$',
-            color='k', fontweight=100, fontsize=15,
-            horizontalalignment='center', verticalalignment='center')
-    ax.text( 0, 0, 1.5, '$|0\\rangle $',
-            color='red', fontweight=400, fontsize=15,
-            horizontalalignment='center', verticalalignment='center')
-    ax.text( 0, 0,-1.5, '$|1\\rangle $',
-            color='red', fontweight=400, fontsize=15,
-            horizontalalignment='center', verticalalignment='center') 
-    ax.axis('off')
-    ax.set_box_aspect( [1, 1, 1] )
+    draw_sphere(ax)
     return fig, ax
 
 class BlochSphereDarwer:
@@ -134,17 +110,8 @@ class BlochSphereDarwer:
         block : bool, optional (default is True)
             Block the program untill the figure is closed.
         """
-        if type(u) is not np.ndarray:
-            raise TypeError(
-                f'The input for u is not numpy.ndarray') from None
-        if not u.shape[0] == 4:
-            raise TypeError(
-                f'The shape of u is {u.shape}, it should be (4, N)') from None
-        u = u[1:4, :]
-        self.fig, self.ax = draw_bloch_sphere('Qubit on bloch equation (plot)')
-        self.ax.plot(*u, linewidth=5)
-        self.ax.plot(*u[:, -1], 'ro')
-        if sepe_N: self.ax.plot(*u[:, ::sepe_N], 'b o')
+        fig, ax = draw_bloch_sphere('Qubit on bloch equation (plot)')
+        self.fig, self.ax = plot_trajectory(u, ax=ax, sepe_N=sepe_N)
         if show: plt.show(block=block)
 
     def animate(self, u: np.ndarray, t_interval: float) -> None:
@@ -157,37 +124,8 @@ class BlochSphereDarwer:
         t_interval : float
             The time interval between each fram of the animation, in seconds.
         '''
-        if type(u) is not np.ndarray:
-            raise TypeError(
-                f'The input for u is not numpy.ndarray') from None
-        if not u.shape[0] == 4:
-            raise TypeError(
-                f'The shape of u is {u.shape}, it should be (4, N)') from None
-        u = u[1:4, :]
-        
-        self.fig, self.ax = draw_bloch_sphere('Qubit on bloch equation (animation)')
-        t_interval = t_interval * 1000 # s --> ms
-        
-        def update_lines(num, datas, lines):
-            for data in datas:
-                # current state
-                lines[0].set_data(data[0:2, num-1:num])
-                lines[0].set_3d_properties(data[2, num-1:num])
-                # trajectory
-                lines[1].set_data(data[0:2, :num])
-                lines[1].set_3d_properties(data[2, :num])
-            return lines
-        linobjs = [
-            # plot current state (as a point on bloch sphere).
-            self.ax.plot(*u, 'ro')[0],
-            # plot trajectory
-            self.ax.plot(*u, linewidth=3)[0]
-        ]
-
-        sam_num = u.shape[1]
-        aniobj = matplotlib.animation.FuncAnimation(
-            self.fig, update_lines, sam_num, fargs=([u], linobjs),
-            interval=t_interval, blit=False, repeat=True, repeat_delay=1000)
+        fig, ax = draw_bloch_sphere('Qubit on bloch equation (animation)')
+        self.fig, self.ax, aniobj = animate_trajectory(u, t_interval, ax=ax)
         plt.show(block = True)
 
 blochdrawer = BlochSphereDarwer()
\ No newline at end of file
@@ -18,19 +18,46 @@ The function `blochsolve` accept an experiment scheme (the instance of `ExpSchem
 as input, then it solves bloch equation numerically according to this experiment 
 setup, returns an (3, N) numpy array that contains the numerical solution of u(t).
 
+When G1 or G2 are large compared with the drive, e.g. in a reset section, the
+equation is stiff. With method='auto', the stiffness of each section is
+estimated from the eigenvalues of the bloch matrix, the ratio of the fastest
+decay rate to the faster of the oscillation and 1/s. Sections with constant
+physical arguments are sampled by the exact propagator regardless of their
+stiffness, stiff sections with callable physical arguments are integrated by
+odeint with the analytic jacobian, and the others by odeint as usual. odeint
+(LSODA) detects stiffness and switches to its implicit method by itself, the
+jacobian only spares its finite differences. So 'auto' gains from the exact
+sampling of constant sections, for callable sections it is about as fast as
+'odeint'.
+
 function
 ----------
 blochsolve
 """
 
 import numpy as np
+import threading
+from concurrent.futures import CancelledError
 from scipy.integrate import odeint
 from .expscheme import Section, ExpScheme
-from typing import Callable, Tuple
+from .rotframe import _rotating_frame_args
+from .serialize import content_hash
+from .cache import ResultCache
+from .propagator import bloch_generator, affine_propagator
+from typing import Callable, List, Tuple
 __all__ = [
     'blochsolve'
 ]
 
+# the settings that decide the solution besides the scheme and dt, see `cache`
+SOLVER_SETTINGS = {'integrator': 'odeint'}
+
+METHOD_OPTIONS = ('odeint', 'auto')
+# sections with a larger stiffness ratio are stiff
+STIFF_RATIO = 10.0
+# the number of times to sample callable physical arguments for stiffness
+_STIFF_SAMPLES = 17
+
 def _dudt(u: tuple,
           t: float,
           I_in: Callable[[float], float] or float,
@@ -91,9 +118,14 @@ def _dudt(u: tuple,
     dudt = dxdt, dydt, dzdt
     return dudt
 
+def _jacobian(u: tuple, t: float, *args) -> np.ndarray:
+    """Return the jacobian of `_dudt` to u, that is the bloch matrix."""
+    I, Q, d, z0, G1, G2 = (arg(t) if callable(arg) else arg for arg in args)
+    return np.array([[-G2, -d, I], [d, -G2, -Q], [-I, Q, -G1]])
+
 def _numint_section(u0: float, duration: float, 
                     args: tuple, sam_num: int,
-                    t0: float = 0) -> np.ndarray:
+                    t0: float = 0, jacobian: bool = False) -> np.ndarray:
     '''
     perform numerical integral of bloch equation.
 
@@ -107,6 +139,10 @@ def _numint_section(u0: float, duration: float,
         = (I, Q, d, z0, G1, G2), the arguments for integration.
     sam_num : int
         The number of sampling points within the time interval.
+    t0 : float, optional
+        The starting time of the time interval. (default is 0)
+    jacobian : bool, optional
+        Give the analytic jacobian to the integrator. (default is False)
 
     Returns 
     ----------
@@ -118,14 +154,227 @@ def _numint_section(u0: float, duration: float,
         u_sol[3, n] is the z-component of n-th sampling time.
     '''
     samt = np.linspace(0, duration, sam_num)
-    u_sol = odeint(_dudt, u0, samt, args = args)
+    u_sol = odeint(_dudt, u0, samt, args = args,
+                   Dfun = _jacobian if jacobian else None)
     u_sol = np.vstack([t0 + samt.reshape(1, -1), u_sol.T])
     return u_sol
 
-def blochsolve(expe: ExpScheme, dt: float) -> Tuple[np.ndarray]:
+def _exact_section(u0: float, duration: float,
+                   args: tuple, sam_num: int,
+                   t0: float = 0) -> np.ndarray:
+    """Sample a section with constant args by its exact propagator, the
+    output is the same as `_numint_section`.
+
+    The samples are equally spaced, so the samples are the initial position
+    propagated by the powers of the propagator of one step, computed by
+    doubling the number of samples in each round."""
+    samt = np.linspace(0, duration, sam_num)
+    step = duration / (sam_num - 1) if sam_num > 1 else 0.
+    power = affine_propagator(bloch_generator(*args), step)
+    u = _propagate_powers(u0, power, sam_num)
+    return np.vstack([t0 + samt.reshape(1, -1), u.T])
+
+def _propagate_powers(u0: np.ndarray, power: np.ndarray,
+                      sam_num: int) -> np.ndarray:
+    """Return u0 propagated by 0 to sam_num-1 steps, with shape
+    (sam_num, 3), given the propagator of one step."""
+    u = np.append(np.asarray(u0, dtype=float), 1.)[None]
+    while len(u) < sam_num:
+        u = np.concatenate([u, u @ power.T])
+        power = power @ power
+    return u[:sam_num, :3]
+
+def _stiffness(args: tuple, duration: float) -> float:
+    '''
+    Estimate the stiffness ratio of a section.
+
+    The eigenvalues of the bloch matrix are -G1 and -G2 when there is no
+    drive, the drive and detune add imaginary parts of oscillation. The
+    stiffness ratio is the fastest decay rate over the faster of the
+    fastest oscillation and 1/duration, the maximum over the section if
+    the args are callable.
+
+    Arguments
+    ----------
+    args : tuple
+        = (I, Q, d, z0, G1, G2), the arguments of the section.
+    duration : float
+        The duration of the section.
+
+    Returns
+    ----------
+    ratio : float
+        The stiffness ratio, the section is stiff if it is much larger
+        than 1.
+    '''
+    if any(callable(arg) for arg in args):
+        samt = np.linspace(0, duration, _STIFF_SAMPLES)
+        args = [[arg(t) if callable(arg) else arg for t in samt]
+                for arg in args]
+    eigvals = np.linalg.eigvals(bloch_generator(*args)[..., :3, :3])
+    decay = np.abs(eigvals.real).max(axis=-1)
+    oscillation = np.abs(eigvals.imag).max(axis=-1)
+    if duration > 0:
+        oscillation = np.maximum(oscillation, 1 / duration)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratio = np.where(decay > 0, decay / oscillation, 0.)
+    return float(np.max(ratio))
+
+def _choose_method(args: tuple, duration: float,
+                   method: str) -> Tuple[str, float]:
+    """Return the method used for a section and its stiffness ratio.
+
+    The methods are 'exact' for constant args, 'odeint-jacobian' for stiff
+    sections integrated by odeint with the analytic jacobian, and 'odeint'."""
+    ratio = _stiffness(args, duration)
+    if method == 'odeint':
+        return 'odeint', ratio
+    if not any(callable(arg) for arg in args):
+        return 'exact', ratio
+    if ratio > STIFF_RATIO:
+        return 'odeint-jacobian', ratio
+    return 'odeint', ratio
+
+def _solve_sections(expe: ExpScheme, dt: float,
+                    cancel: threading.Event = None,
+                    methods: List[str] = None) -> List[np.ndarray]:
+    '''
+    Solve each section in order, see `blochsolve`.
+
+    Returns
+    ----------
+    u_sol_sofar : list
+        The numerical solution of u(t) for each section.
+    '''
+    starts, args_sections = _section_args(expe)
+    if methods is None:
+        methods = ['odeint'] * len(args_sections)
+    u_sol_sofar = []
+    for section, t_sofar, args, method in zip(
+            expe.sequence, starts, args_sections, methods):
+        if cancel is not None and cancel.is_set():
+            raise CancelledError('blochsolve is cancelled.')
+        if len(u_sol_sofar) == 0:
+            u_start = expe.u0
+        else:
+            u_start = u_sol_sofar[-1].T[-1, 1:4]
+        # at least the start and the end, a section of no duration keeps
+        # its start only
+        sam_num = max(int(section.s / dt), 2) if section.s > 0 else 1
+        if method == 'exact':
+            u_sol_section = _exact_section(
+                u_start, section.s, args, sam_num, t_sofar)
+        else:
+            u_sol_section = _numint_section(
+                u_start, section.s, args, sam_num, t_sofar,
+                jacobian=(method == 'odeint-jacobian'))
+        u_sol_sofar.append(u_sol_section)
+    return u_sol_sofar
+
+def _section_args(expe: ExpScheme) -> Tuple[List[float], List[tuple]]:
+    """Return the starting time and the arguments for each section."""
+    starts = []
+    args_sections = []
+    t_sofar = 0
+    for section in expe.sequence:
+        args = tuple(section.phy_args[name]
+                     for name in ('I', 'Q', 'd', 'z0', 'G1', 'G2'))
+        if expe.carrier is not None:
+            args = _rotating_frame_args(
+                args, expe.carrier, expe.counter_rotating, t_sofar)
+        starts.append(t_sofar)
+        args_sections.append(args)
+        t_sofar += section.s
+    return starts, args_sections
+
+def _section_dudt(args: tuple) -> Callable:
+    """Return dudt(u, t) of a section, specialized if args are constant."""
+    if any(callable(arg) for arg in args):
+        return lambda u, t: _dudt(u, t, *args)
+    I, Q, d, z0, G1, G2 = args
+    G1z0 = G1 * z0
+    def dudt(u, t):
+        x, y, z = u
+        return (-G2*x - d*y + I*z, d*x - G2*y - Q*z, -I*x + Q*y - G1*z + G1z0)
+    return dudt
+
+def _solve_global(expe: ExpScheme, dt: float,
+                  cancel: threading.Event = None) -> Tuple[np.ndarray]:
+    '''
+    Solve all sections on a global time grid.
+
+    Each section is sampled by ceil(s/dt) equal intervals, so the section
+    boundaries are exact sampling times shared by adjacent sections. The
+    sections with constant arguments are sampled by the powers of the
+    exact propagator of one step, the step propagators of all of them are
+    computed in a batch, the others are integrated from their boundary,
+    so no integration crosses a pulse edge.
+
+    Returns
+    ----------
+    u_sol : numpy.ndarray with shape (4, N)
+        The numerical solution of u(t), without duplicated samples.
+    bounds : numpy.ndarray with shape (n+1,)
+        The index of the sample at the start of each section, then the
+        index of the last sample.
+    '''
+    starts, args_sections = _section_args(expe)
+    sections = expe.sequence
+    sam_nums = [int(np.ceil(section.s / dt - 1e-9)) if section.s > 0 else 0
+                for section in sections]
+    samt = np.concatenate([np.zeros(1)] + [
+        np.linspace(start, start + section.s, sam_num + 1)[1:]
+        for start, section, sam_num in zip(starts, sections, sam_nums)])
+    bounds = np.cumsum([0] + sam_nums)
+    constant = [not any(callable(arg) for arg in args)
+                for args in args_sections]
+    # step propagators of all constant sections in one batch
+    exact = [k for k, is_constant in enumerate(constant)
+             if is_constant and sam_nums[k] > 0]
+    steps = {}
+    if exact:
+        args = np.array([args_sections[k] for k in exact], dtype=float).T
+        step = np.array([sections[k].s / sam_nums[k] for k in exact])
+        steps = dict(zip(exact,
+                         affine_propagator(bloch_generator(*args), step)))
+    u = np.empty((len(samt), 3))
+    u[0] = expe.u0
+    for k, (start, args) in enumerate(zip(starts, args_sections)):
+        if cancel is not None and cancel.is_set():
+            raise CancelledError('blochsolve is cancelled.')
+        first, last = bounds[k], bounds[k+1]
+        if last == first:
+            continue
+        if constant[k]:
+            u[first:last+1] = _propagate_powers(
+                u[first], steps[k], sam_nums[k] + 1)
+        else:
+            dudt = _section_dudt(args)
+            u[first:last+1] = odeint(
+                lambda u, t: dudt(u, t - start), u[first],
+                samt[first:last+1])
+    u_sol = np.vstack([samt.reshape(1, -1), u.T])
+    return u_sol, bounds
+
+def _split_shared(u_sol: np.ndarray, bounds: np.ndarray) -> Tuple[np.ndarray]:
+    """Split u_sol into sections that share the boundary samples."""
+    return tuple(u_sol[:, start:stop+1]
+                 for start, stop in zip(bounds[:-1], bounds[1:]))
+
+def blochsolve(expe: ExpScheme, dt: float,
+               *,
+               grid: str = 'section',
+               method: str = 'odeint',
+               full_output: bool = False,
+               cancel: threading.Event = None,
+               cache: ResultCache = None) -> Tuple[np.ndarray]:
     '''
     Solve a given experiment scheme.
 
+    If the experiment scheme has a carrier, the bloch equation is solved in
+    the frame rotating at the carrier, use `to_lab_frame` to transform the
+    solution back to the lab frame.
+
     Arguments
     ----------
     expe : ExpScheme object
@@ -133,6 +382,34 @@ def blochsolve(expe: ExpScheme, dt: float) -> Tuple[np.ndarray]:
     dt : float
         The time interval for sampling in numerical integration.
 
+    Keyword Arguments
+    ----------
+    grid : str, optional
+        'section' integrates each section separately with int(s/dt)
+        samples, at least its start and end, the boundary sample appears
+        in both adjacent sections. 'global' samples all sections on a
+        global time grid, with ceil(s/dt) intervals in each section, so
+        the section boundaries are not duplicated in u_sol. On it the
+        sections with constant physical arguments are sampled by their
+        exact propagators, computed in a batch, and the others are
+        integrated. (default is 'section')
+    method : str, optional
+        'odeint' integrates every section numerically. 'auto' chooses
+        for each section by its stiffness, sections with constant
+        physical arguments are sampled by the exact propagator, stiff
+        sections are integrated by odeint with the analytic jacobian,
+        only with grid='section'. (default is 'odeint')
+    full_output : bool, optional
+        Also return a dictionary of the solve stats. (default is False)
+    cancel : threading.Event, optional
+        Checked before each section, if it is set, stop solving and raise
+        `concurrent.futures.CancelledError`. (default is None)
+    cache : ResultCache, optional
+        Load the solution from the cache if the same experiment scheme was
+        solved with the same dt, otherwise store the solution into it. All
+        physical arguments must be serializable, see module `serialize`.
+        (default is None)
+
     Returns
     ----------
     u_sol : numpy.ndarray with shape (4, N)
@@ -145,28 +422,52 @@ def blochsolve(expe: ExpScheme, dt: float) -> Tuple[np.ndarray]:
         A list contains numerical solutions of u(t) for each section in
         the experiment sheme. Each element in the list has the discription
         as u_sol above.
+    info : dict
+        Only returned if full_output is true. info['method'] is the list
+        of the method used for each section, one of 'exact', 'odeint' and
+        'odeint-jacobian'. info['stiffness'] is the list of the estimated
+        stiffness ratio of each section.
     '''
-    u_sol_sofar = []
-    t_sofar = 0
-    for section in expe.sequence:
-        if len(u_sol_sofar) == 0:
-            u_start = expe.u0
-        else:
-            u_start = u_sol_sofar[-1].T[-1, 1:4]
-        sam_num = int(section.s / dt)
-        args = (
-            section.phy_args['I'],
-            section.phy_args['Q'],
-            section.phy_args['d'],
-            section.phy_args['z0'],
-            section.phy_args['G1'],
-            section.phy_args['G2'],
-        )
-        u_sol_section = _numint_section(
-            u_start, section.s, args, sam_num, t_sofar)
-        u_sol_sofar.append(u_sol_section)
-        t_sofar += section.s
-        
+    if grid not in ('section', 'global'):
+        raise ValueError(
+            f"The grid {grid} is not one of ('section', 'global').") from None
+    if method not in METHOD_OPTIONS:
+        raise ValueError(
+            f'The method {method} is not one of {METHOD_OPTIONS}.') from None
+    if grid == 'global' and method != 'odeint':
+        raise ValueError(
+            f"The method {method} is not supported by grid 'global'.") from None
+    methods = None
+    info = {'method': [], 'stiffness': []}
+    if method != 'odeint' or full_output:
+        _, args_sections = _section_args(expe)
+        for args, section in zip(args_sections, expe.sequence):
+            section_method, ratio = _choose_method(args, section.s, method)
+            if grid == 'global' and not any(callable(arg) for arg in args):
+                section_method = 'exact'
+            info['method'].append(section_method)
+            info['stiffness'].append(ratio)
+        methods = info['method']
+    output = (info,) if full_output else ()
+    if cache is not None:
+        key = cache.key(kind='blochsolve', scheme=content_hash(expe),
+                        dt=float(dt), solver={**SOLVER_SETTINGS, 'grid': grid,
+                                              'method': method})
+        arrays = cache.get(key)
+        if arrays is not None:
+            u_sol, splits = arrays['u_sol'], arrays['splits']
+            if grid == 'global':
+                return (u_sol, _split_shared(u_sol, splits)) + output
+            return (u_sol, tuple(np.split(u_sol, splits, axis=1))) + output
+    if grid == 'global':
+        u_sol, bounds = _solve_global(expe, dt, cancel)
+        if cache is not None:
+            cache.put(key, {'u_sol': u_sol, 'splits': bounds})
+        return (u_sol, _split_shared(u_sol, bounds)) + output
+    u_sol_sofar = _solve_sections(expe, dt, cancel, methods)
     u_sol_sections = tuple(u_sol_section for u_sol_section in u_sol_sofar)
     u_sol = np.hstack(u_sol_sofar)
-    return u_sol, u_sol_sections
+    if cache is not None:
+        splits = np.cumsum([u.shape[1] for u in u_sol_sofar])[:-1]
+        cache.put(key, {'u_sol': u_sol, 'splits': splits})
+    return (u_sol, u_sol_sections) + output
@@ -0,0 +1,225 @@
+# -*- coding: utf-8 -*-
+"""Persistent content-addressed cache of solutions on disk.
+
+Notebooks and scripts often solve the same experiment schemes again and
+again. By passing a `ResultCache` to `blochsolve` or `sweep`, the solution is
+stored on disk under a key that hashes the content of the experiment scheme
+(see `serialize.content_hash`), the sampling time and the solver settings.
+Solving an identical experiment again, even in another process, loads the
+stored solution instead.
+
+    cache = bs.ResultCache('.blochsimu_cache', max_bytes=2**30)
+    u_sol, u_sol_section = bs.blochsolve(expe, dt=5e-7, cache=cache)
+    print(cache.stats())
+
+Each entry is a `.npz` file, compressed by default. Entries are written to a
+temporary file then renamed, which is atomic, so concurrent processes never
+read a partially written entry. When the total size exceeds the cap, the
+least recently used entries are evicted, with the use time recorded as the
+modification time of the file.
+
+Class
+----------
+ResultCache
+"""
+
+import os
+import json
+import hashlib
+import tempfile
+import threading
+import zipfile
+import numpy as np
+from typing import Dict
+__all__ = [
+    'ResultCache'
+]
+
+class ResultCache:
+    """A directory of solutions keyed by content hash, with LRU eviction.
+
+    Instance variables
+    ----------
+    directory : str
+        The directory that stores the entries.
+    max_bytes : int or None
+        The cap of the total size of entries, in bytes.
+    compress : bool
+        Whether entries are compressed.
+    hits : int
+        The number of successful lookups by this object.
+    misses : int
+        The number of failed lookups by this object.
+
+    Public methods
+    ----------
+    key -- hash the content that decides a solution into a key.
+    get -- load the arrays stored under a key.
+    put -- store arrays under a key.
+    stats -- return the hit/miss statistics and the size of the cache.
+    clear -- remove all entries.
+    """
+
+    SUFFIX = '.npz'
+
+    def __init__(self, directory: str,
+                 *,
+                 max_bytes: int = 2**30,
+                 compress: bool = True) -> None:
+        """Set the directory and the size cap, create the directory.
+
+        Argument
+        ----------
+        directory : str
+            The directory that stores the entries, may be shared by
+            several processes.
+
+        Keyword Arguments
+        ----------
+        max_bytes : int, optional
+            The cap of the total size of entries, in bytes. (default is
+            1 GiB, None for no cap)
+        compress : bool, optional
+            Compress the entries. (default is True)
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.compress = compress
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(**content) -> str:
+        """Hash the content into a key.
+
+        Keyword Arguments
+        ----------
+        **content :
+            JSON-compatible values that decide the solution, e.g. the content
+            hash of the experiment scheme, the sampling time and the solver.
+
+        Returns
+        ----------
+        key : str
+            The hexadecimal SHA-256 digest.
+        """
+        text = json.dumps(content, sort_keys=True, separators=(',', ':'))
+        return hashlib.sha256(text.encode()).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key + self.SUFFIX)
+
+    def _count(self, hit: bool) -> None:
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def get(self, key: str) -> Dict[str, np.ndarray] or None:
+        """Load the arrays stored under a key.
+
+        Argument
+        ----------
+        key : str
+            The key, see `key`.
+
+        Returns
+        ----------
+        arrays : dict or None
+            The stored arrays, None if the key is not in the cache.
+        """
+        path = self._path(key)
+        try:
+            with np.load(path) as npz:
+                arrays = dict(npz)
+        except (FileNotFoundError, zipfile.BadZipFile, ValueError, OSError):
+            # missing, evicted by another process or unreadable
+            self._count(hit=False)
+            return None
+        try:
+            os.utime(path) # mark as recently used
+        except OSError:
+            pass # the hit is valid, only its use time is not recorded
+        self._count(hit=True)
+        return arrays
+
+    def put(self, key: str, arrays: Dict[str, np.ndarray]) -> None:
+        """Store arrays under a key atomically, then evict if over the cap.
+
+        Arguments
+        ----------
+        key : str
+            The key, see `key`.
+        arrays : dict
+            The arrays to be stored.
+        """
+        save = np.savez_compressed if self.compress else np.savez
+        file = tempfile.NamedTemporaryFile(
+            dir=self.directory, suffix='.tmp', delete=False)
+        try:
+            with file:
+                save(file, **arrays)
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(file.name, self._path(key))
+        except BaseException:
+            os.remove(file.name)
+            raise
+        if self.max_bytes is not None:
+            self._evict(keep=self._path(key))
+
+    def _entries(self) -> list:
+        """Return (mtime, size, path) of all entries."""
+        entries = []
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith(self.SUFFIX):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def _evict(self, keep: str = None) -> None:
+        """Remove the least recently used entries until under the cap,
+        except the entry at path keep."""
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass # removed by another process
+            total -= size
+
+    def stats(self) -> dict:
+        """Return the hit/miss statistics and the size of the cache.
+
+        Returns
+        ----------
+        stats : dict
+            With keys 'hits', 'misses', 'entries' and 'bytes'.
+        """
+        entries = self._entries()
+        return {'hits': self.hits, 'misses': self.misses,
+                'entries': len(entries),
+                'bytes': sum(size for _, size, _ in entries)}
+
+    def clear(self) -> None:
+        """Remove all entries."""
+        for _, _, path in self._entries():
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def __repr__(self):
+        return f"A result cache at {self.directory}"
@@ -0,0 +1,322 @@
+# -*- coding: utf-8 -*-
+"""Run sweep jobs described by a file from the command line.
+
+A job file describes an experiment scheme and the values to sweep, instead of
+a hand-edited script :
+
+    python -m blochsimu run ramsey_job.toml --workers 4
+
+The job is a TOML file (or JSON with the same structure). The scheme has the
+format of `serialize.scheme_to_dict`, without the need of "format" and
+"version", where any string "$name" is replaced by the value of the swept
+parameter `name` :
+
+    dt = 1e-7
+    chunk_size = 64           # points solved and saved together
+
+    [scheme]
+    u0 = [0.0, 0.0, 1.0]
+    defaults = {z0 = 1.0, I = 0.0, Q = 0.0, d = 1e+5, G1 = 11764.7, G2 = 6666.7}
+
+    [[scheme.sequence]]
+    s = 2.2e-6
+    phy_args = {I = 7e+5}
+
+    [[scheme.sequence]]
+    s = "$tau"
+
+    [[scheme.sequence]]
+    s = 2.2e-6
+    phy_args = {I = 7e+5}
+
+    [sweep]
+    tau = {start = 1e-6, stop = 400e-6, num = 201}   # or a list of values
+
+Several swept parameters span a grid in the order they are written. The
+points are solved in chunks by `--workers` processes, and each completed
+chunk is saved to the output directory at once, by writing a temporary file
+and renaming it. A killed job run again with the same output directory skips
+the saved chunks. When all chunks are done, `result.npz` holds the values of
+each parameter and u_end with shape (n0, n1, ..., 3). Progress and throughput
+are printed to stderr.
+
+Reading TOML needs Python 3.11 or the package `tomli`.
+
+function
+----------
+load_job
+run_job
+main
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from .serialize import FORMAT, VERSION, scheme_from_dict
+from .sweep import _solve_ends
+from typing import Dict, List
+__all__ = [
+    'load_job',
+    'run_job',
+    'main'
+]
+
+JOB_FILE = 'job.json'
+RESULT_FILE = 'result.npz'
+
+def load_job(path: str) -> dict:
+    '''
+    Load and check a job file.
+
+    Argument
+    ----------
+    path : str
+        The path of the job file, TOML if it ends with .toml, otherwise
+        JSON.
+
+    Returns
+    ----------
+    job : dict
+        The job with keys 'scheme', 'sweep', 'dt' and 'chunk_size', the
+        sweep maps each parameter name to its list of values.
+    '''
+    if path.endswith('.toml'):
+        try:
+            import tomllib
+        except ImportError:
+            try:
+                import tomli as tomllib
+            except ImportError:
+                raise ImportError(
+                    'Reading TOML needs Python 3.11 or the package tomli, '
+                    + 'or write the job in JSON.') from None
+        with open(path, 'rb') as f:
+            job = tomllib.load(f)
+    else:
+        with open(path, 'r', encoding='utf-8') as f:
+            job = json.load(f)
+    for key in ('scheme', 'sweep', 'dt'):
+        if key not in job:
+            raise ValueError(
+                f'The job {path} has no "{key}".') from None
+    sweep = {}
+    for name, values in job['sweep'].items():
+        if name == 'u_end':
+            raise ValueError(
+                'The name u_end is the result, not a parameter.') from None
+        if isinstance(values, dict):
+            values = np.linspace(values['start'], values['stop'],
+                                 int(values['num'])).tolist()
+        if not isinstance(values, list) or len(values) == 0:
+            raise ValueError(
+                f'The sweep of {name} is not a non-empty list nor '
+                + '{start, stop, num}.') from None
+        sweep[name] = [float(value) for value in values]
+    if len(sweep) == 0:
+        raise ValueError(f'The job {path} sweeps nothing.') from None
+    chunk_size = int(job.get('chunk_size', 64))
+    if chunk_size < 1:
+        raise ValueError('The chunk_size should be at least 1.') from None
+    scheme = {'format': FORMAT, 'version': VERSION, 'carrier': None,
+              'counter_rotating': 'rwa', **job['scheme']}
+    scheme['sequence'] = [{'phy_args': {}, **section}
+                          for section in scheme.get('sequence', [])]
+    job = {'scheme': scheme, 'sweep': sweep, 'dt': float(job['dt']),
+           'chunk_size': chunk_size}
+    # fail early on unknown parameters and invalid schemes
+    try:
+        scheme_from_dict(_substitute(
+            scheme, {name: values[0] for name, values in sweep.items()}))
+    except KeyError as e:
+        raise ValueError(f'The scheme of {path} has no {e}.') from None
+    return job
+
+def _substitute(data, values: Dict[str, float]):
+    """Replace every string "$name" in data by values[name]."""
+    if isinstance(data, dict):
+        return {key: _substitute(value, values) for key, value in data.items()}
+    if isinstance(data, list):
+        return [_substitute(value, values) for value in data]
+    if isinstance(data, str) and data.startswith('$'):
+        if data[1:] not in values:
+            raise ValueError(
+                f'The parameter {data} is not swept.') from None
+        return values[data[1:]]
+    return data
+
+def _grid_values(sweep: Dict[str, list], index: int) -> Dict[str, float]:
+    """Return the parameter values at a flat index of the grid."""
+    values = {}
+    for name, axis in reversed(list(sweep.items())):
+        index, i = divmod(index, len(axis))
+        values[name] = axis[i]
+    return values
+
+def _solve_chunk(job: dict, start: int, stop: int) -> np.ndarray:
+    """Solve the final positions of the points [start, stop) of a job."""
+    expes = [scheme_from_dict(_substitute(
+                 job['scheme'], _grid_values(job['sweep'], index)))
+             for index in range(start, stop)]
+    return _solve_ends(expes, job['dt'])
+
+def _save_atomic(path: str, **arrays) -> None:
+    """Save arrays to a .npy or .npz file by writing then renaming."""
+    directory = os.path.dirname(path) or '.'
+    file = tempfile.NamedTemporaryFile(
+        dir=directory, suffix='.tmp', delete=False)
+    try:
+        with file:
+            if path.endswith('.npy'):
+                np.save(file, arrays['u_end'])
+            else:
+                np.savez(file, **arrays)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(file.name, path)
+    except BaseException:
+        os.remove(file.name)
+        raise
+
+def _chunk_path(output: str, chunk: int) -> str:
+    return os.path.join(output, f'chunk_{chunk:06d}.npy')
+
+def _progress(done: int, total: int, resumed: int, points: int,
+              elapsed: float) -> None:
+    """Print the progress and throughput to stderr, resumed chunks were
+    done by an earlier run."""
+    rate = points / elapsed if elapsed > 0 else 0.
+    eta = ((total - done) / (done - resumed) * elapsed if done > resumed
+           else float('nan'))
+    sys.stderr.write(f'\rchunks {done}/{total}, {rate:.1f} points/s, '
+                     + f'eta {eta:.0f} s ')
+    sys.stderr.flush()
+
+def run_job(job: dict, output: str,
+            *,
+            workers: int = None,
+            progress: bool = True) -> np.ndarray:
+    '''
+    Run a job, resume from the chunks saved in the output directory.
+
+    Arguments
+    ----------
+    job : dict
+        The job, see `load_job`.
+    output : str
+        The output directory, created if missing.
+
+    Keyword Arguments
+    ----------
+    workers : int, optional
+        The number of processes. (default is None, solve in this process)
+    progress : bool, optional
+        Print the progress and throughput to stderr. (default is True)
+
+    Returns
+    ----------
+    u_end : numpy.ndarray with shape (n0, n1, ..., 3)
+        The final position for each point of the grid.
+    '''
+    os.makedirs(output, exist_ok=True)
+    # partial files of a killed run
+    for name in os.listdir(output):
+        if name.endswith('.tmp'):
+            os.remove(os.path.join(output, name))
+    job_path = os.path.join(output, JOB_FILE)
+    if os.path.exists(job_path):
+        with open(job_path, 'r', encoding='utf-8') as f:
+            if json.load(f) != job:
+                raise ValueError(
+                    f'The output directory {output} belongs to another job.'
+                    ) from None
+    else:
+        with open(job_path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(job, f, indent=1)
+        os.replace(job_path + '.tmp', job_path)
+    shape = tuple(len(values) for values in job['sweep'].values())
+    n_points = int(np.prod(shape))
+    chunk_size = job['chunk_size']
+    n_chunks = -(-n_points // chunk_size)
+    todo = [chunk for chunk in range(n_chunks)
+            if not os.path.exists(_chunk_path(output, chunk))]
+    done = resumed = n_chunks - len(todo)
+    if progress and done:
+        sys.stderr.write(f'resume with {done} of {n_chunks} chunks done\n')
+    bounds = lambda chunk: (chunk * chunk_size,
+                            min((chunk + 1) * chunk_size, n_points))
+    t_start = time.perf_counter()
+    points = 0
+
+    def finish(chunk, u_end):
+        nonlocal done, points
+        _save_atomic(_chunk_path(output, chunk), u_end=u_end)
+        done += 1
+        points += len(u_end)
+        if progress:
+            _progress(done, n_chunks, resumed, points,
+                      time.perf_counter() - t_start)
+
+    if workers is None or workers <= 1:
+        for chunk in todo:
+            finish(chunk, _solve_chunk(job, *bounds(chunk)))
+    else:
+        with ProcessPoolExecutor(workers) as executor:
+            futures = {executor.submit(_solve_chunk, job, *bounds(chunk)):
+                       chunk for chunk in todo}
+            for future in as_completed(futures):
+                finish(futures[future], future.result())
+    if progress:
+        sys.stderr.write('\n')
+    u_end = np.concatenate([np.load(_chunk_path(output, chunk))
+                            for chunk in range(n_chunks)])
+    u_end = u_end.reshape(shape + (3,))
+    axes = {name: np.array(values) for name, values in job['sweep'].items()}
+    _save_atomic(os.path.join(output, RESULT_FILE), u_end=u_end, **axes)
+    return u_end
+
+def main(argv: List[str] = None) -> int:
+    '''
+    The entry point of `python -m blochsimu`.
+
+    Argument
+    ----------
+    argv : list[str], optional
+        The command line arguments. (default is None, use sys.argv)
+
+    Returns
+    ----------
+    status : int
+        The exit status.
+    '''
+    parser = argparse.ArgumentParser(
+        prog='python -m blochsimu',
+        description='Simulate a qubit on the bloch sphere.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    run = commands.add_parser(
+        'run', help='run a sweep job, resume if it was stopped')
+    run.add_argument('job', help='the job file, .toml or .json')
+    run.add_argument('-o', '--output', default=None,
+                     help='the output directory (default is the job file '
+                     + 'name without extension)')
+    run.add_argument('-w', '--workers', type=int, default=None,
+                     help='the number of processes (default is 1)')
+    run.add_argument('-q', '--quiet', action='store_true',
+                     help='do not print the progress')
+    args = parser.parse_args(argv)
+    output = args.output
+    if output is None:
+        output = os.path.splitext(args.job)[0]
+    try:
+        job = load_job(args.job)
+        run_job(job, output, workers=args.workers, progress=not args.quiet)
+    except (OSError, ImportError, ValueError, TypeError) as e:
+        sys.stderr.write(f'error: {e}\n')
+        return 1
+    if not args.quiet:
+        sys.stderr.write(f'saved {os.path.join(output, RESULT_FILE)}\n')
+    return 0
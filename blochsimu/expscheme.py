@@ -21,6 +21,10 @@ import numpy as np
 import numbers
 from typing import Callable, Tuple, List
 from matplotlib import pyplot as plt
+from .rotframe import COUNTER_ROTATING_OPTIONS
+from .render import plot_phy_arg
+from .waveform import (PiecewiseConstant, InterpolationTable, tabulate,
+                       INTERPOLATION_KINDS)
 __all__ = [
     'Section', 
     'ExpScheme'
@@ -94,6 +98,13 @@ class ExpScheme:
         Default physical arguments.
     u0 : numpy.ndarray with shape (3,)
         The inital position, with element [x0, y0, z0].
+    carrier : float or None
+        The angular frequency of the microwave carrier. If not None, I and Q
+        are the drive envelope and d is the detune from the carrier, the
+        experiment is solved in the frame rotating at the carrier.
+    counter_rotating : str
+        The treatment of the counter-rotating drive term, one of 'rwa',
+        'bloch-siegert' or 'exact'. Only used when carrier is not None.
     fig : matplotlib.figure.Figure
         An Figure that is used to disaply physical argument plot.
     ax : matplotlib.axes._axes.Axes
@@ -103,6 +114,8 @@ class ExpScheme:
     Public method
     ----------
     plot_phy_arg -- plot a physical quantity throughtout experiment.
+    precompile -- tabulate callable physical arguments for fast evaluation.
+    compile -- reuse the propagators of repeated sections and blocks.
     """
 
     def __init__(self, 
@@ -113,7 +126,9 @@ class ExpScheme:
                  Q: Callable[[float], float] or float,
                  d: Callable[[float], float] or float,
                  G1: Callable[[float], float] or float,
-                 G2: Callable[[float], float] or float) -> None:
+                 G2: Callable[[float], float] or float,
+                 carrier: float = None,
+                 counter_rotating: str = 'rwa') -> None:
         """Set up an experiment scheme with default physical arguments.
         
         Keyword Arguments
@@ -132,6 +147,14 @@ class ExpScheme:
             relaxation rate,
         G2 : callable(t) or float
             decoherence rate.
+        carrier : float, optional
+            The angular frequency of the microwave carrier, in rad/s. If 
+            provided, I and Q are the envelope of the drive and d is the
+            detune from the carrier, see module `rotframe`. (default is None,
+            the drive is given directly by I and Q)
+        counter_rotating : str, optional
+            The treatment of the counter-rotating drive term, one of 'rwa',
+            'bloch-siegert' or 'exact'. (default is 'rwa')
         """
         if (not isinstance(u0, (tuple, list)) or
             len(u0) != 3):
@@ -143,6 +166,15 @@ class ExpScheme:
             'z0': z0, 'I': I, 'Q': Q,
             'd': d, 'G1': G1, 'G2': G2}
         _check_phyargs_input(self.default_phy_args)
+        if carrier is not None and not isinstance(carrier, numbers.Real):
+            raise TypeError(
+                f'The carrier, {carrier}, is not a real number.') from None
+        if counter_rotating not in COUNTER_ROTATING_OPTIONS:
+            raise ValueError(
+                f'The counter_rotating option {counter_rotating} is not one '
+                + f'of {COUNTER_ROTATING_OPTIONS}.') from None
+        self.carrier = carrier
+        self.counter_rotating = counter_rotating
         self._sequence = []
         self.total_time = 0
         self.fig = None
@@ -172,34 +204,98 @@ class ExpScheme:
             costimize the plotting, then manually call `plt.show()` afterwards.
         block : bool, optional (default is True)
             Block the program untill the figure is closed.
+
+        See `render.plot_phy_arg` to plot without pyplot and without
+        storing the figure, e.g. in parallel threads.
         """
-        magnitude = []
-        samt = []
-        t_sofar = 0
-        for act in self.sequence:
-            goal = act.phy_args[phyarg_name]
-            if callable(goal):
-                samt_section = np.linspace(
-                    t_sofar, act.s+t_sofar, int(act.s/dt))
-                magnitude_section = [goal(t-t_sofar) for t in samt_section]
-                samt = np.concatenate((samt, samt_section))
-                magnitude = np.concatenate((magnitude, magnitude_section))
-            else: # is constant
-                samt_section = [t_sofar, act.s+t_sofar]
-                samt = np.concatenate((samt, samt_section))
-                magnitude =  np.concatenate((magnitude, [goal, goal]))
-            t_sofar += act.s
-        
         self.fig = plt.figure(phyarg_name)
-        self.ax = self.fig.add_subplot(111)
-        if mu_s_scale:
-            self.ax.set_xlabel('$t/\\mu s$')
-            self.ax.plot(samt * 1e+6, magnitude)
-        else:
-            self.ax.set_xlabel('$t/s$')
-            self.ax.plot(samt, magnitude)
+        self.fig, self.ax = plot_phy_arg(
+            self, phyarg_name, dt, ax=self.fig.add_subplot(111),
+            mu_s_scale=mu_s_scale)
         if show: plt.show(block=block)
 
+    def precompile(self, tol: float = 1e-6, kind: str = 'cubic') -> dict:
+        """Replace callable physical arguments by interpolation tables.
+
+        The integrator evaluates the physical arguments one time at a time,
+        which is slow for shaped pulses. Each callable physical argument of
+        each section is sampled once on an adaptive grid over the section,
+        see `waveform.tabulate`, and replaced by the table. Sections sharing
+        the same callable and duration share the table. A callable default
+        physical argument is tabulated once over the longest section, and
+        the table replaces both the default and the sections that use it.
+        `PiecewiseConstant` and tables are kept as they are. Tables can be
+        serialized, see module `serialize`, even if the callables can not.
+
+        Arguments
+        ----------
+        tol : float, optional
+            The tolerance of the interpolation error, relative to the
+            maximal magnitude of each wave form. (default is 1e-6)
+        kind : str, optional
+            The interpolation, 'linear' or 'cubic'. A coarse linear table
+            has a kink at each sample, which makes the integrator take
+            small steps. (default is 'cubic')
+
+        Returns
+        ----------
+        errors : dict
+            The maximal estimated absolute error of the tables of each
+            tabulated physical argument.
+        """
+        if kind not in INTERPOLATION_KINDS:
+            raise ValueError(
+                f'The kind {kind} is not one of {INTERPOLATION_KINDS}.'
+                ) from None
+        is_table = lambda arg: isinstance(arg, (PiecewiseConstant,
+                                                InterpolationTable))
+        tables = {}
+        errors = {}
+        # defaults, sections only sample them on [0, s]
+        s_max = max((section.s for section in self.sequence), default=0)
+        default_tables = {}
+        for name, arg in self.default_phy_args.items():
+            if callable(arg) and not is_table(arg) and s_max > 0:
+                default_tables[name] = (arg, tabulate(arg, s_max, tol, kind))
+                self.default_phy_args[name] = default_tables[name][1]
+                errors[name] = default_tables[name][1].error
+        for section in self.sequence:
+            for name, arg in section.phy_args.items():
+                if name in default_tables and arg is default_tables[name][0]:
+                    section.phy_args[name] = default_tables[name][1]
+                    continue
+                if (not callable(arg) or section.s <= 0
+                        or is_table(arg)):
+                    continue
+                key = (id(arg), section.s)
+                if key not in tables:
+                    tables[key] = tabulate(arg, section.s, tol, kind)
+                section.phy_args[name] = tables[key]
+                errors[name] = max(errors.get(name, 0.), tables[key].error)
+        return errors
+
+    def compile(self):
+        """Compile into a DAG of unique sections and repeated blocks.
+
+        See module `seqcompile`, the propagator of each unique section and
+        block is computed once and composed.
+
+        Returns
+        ----------
+        compiled : seqcompile.CompiledScheme
+            Solve it by `compiled.final_state()`, see the dedup ratio in
+            `compiled.stats`.
+        """
+        from .seqcompile import compile_scheme
+        return compile_scheme(self)
+
+    def __getstate__(self) -> dict:
+        """Pickle without the figure, which belongs to this process."""
+        state = self.__dict__.copy()
+        state['fig'] = None
+        state['ax'] = None
+        return state
+
     @property
     def sequence(self):
         return self._sequence
@@ -0,0 +1,263 @@
+# -*- coding: utf-8 -*-
+"""Fit measured T1, T2, Ramsey and echo data with bloch simulation models.
+
+A measured curve, e.g. the final z-component of a Ramsey experiment versus the
+waiting time tau, is fitted by a model that sweeps an experiment scheme over
+the same values. The model is given as a template, a callable that returns the
+experiment scheme for a value with nominal physical arguments, then fitted
+parameters overwrite those of every section :
+
+  * G1 -- relaxation rate,
+  * G2 -- decoherence rate,
+  * d -- detune,
+  * scale -- a factor multiply to I and Q, e.g. the unknown attenuation.
+
+The template is called only once for each value. All experiment schemes are
+stacked into arrays (see module `sweep`), so each fit iteration is a batched
+evaluation of exact propagators, with the jacobian computed exactly by the
+derivatives of the propagators (see module `propagator`). Sections must
+therefore have constant physical arguments, and a scheme with a carrier must
+use the rotating wave approximation, since the Bloch-Siegert shift depends on
+the fitted detune and scale.
+
+function
+----------
+fit_bloch
+fit_bloch_many
+"""
+
+import numpy as np
+from scipy.optimize import least_squares, OptimizeResult
+from concurrent.futures import ThreadPoolExecutor
+from .expscheme import ExpScheme
+from .sweep import _stack_schemes
+from .propagator import (PHY_ARG_NAMES, bloch_generator, generator_derivative,
+                         affine_propagator, propagator_derivative)
+from typing import Callable, Dict, Iterable, List, Tuple
+__all__ = [
+    'fit_bloch',
+    'fit_bloch_many'
+]
+
+FIT_PARAMETERS = ('G1', 'G2', 'd', 'scale')
+
+OBSERVABLES = {
+    # linear function of the augmented position (x, y, z, 1)
+    'x': (1, 0, 0, 0),
+    'y': (0, 1, 0, 0),
+    'z': (0, 0, 1, 0),
+    'p0': (0, 0, 0.5, 0.5),  # probability of |0>
+    'p1': (0, 0, -0.5, 0.5), # probability of |1>
+}
+
+def _compile_template(template: Callable[[float], ExpScheme],
+                      x: Iterable) -> Tuple[np.ndarray]:
+    """Build and stack the experiment scheme for every value in x."""
+    expes = [template(value) for value in x]
+    for expe in expes:
+        if expe.carrier is not None and expe.counter_rotating != 'rwa':
+            raise ValueError(
+                f"The counter_rotating '{expe.counter_rotating}' changes the "
+                + 'detune and the drive that are fitted, only the '
+                + "rotating wave approximation 'rwa' can be fitted."
+                ) from None
+    return _stack_schemes(expes)
+
+def _model(stacked: Tuple[np.ndarray], params: Dict[str, float],
+           observable: np.ndarray, fit: Tuple[str],
+           jacobian: bool = False) -> Tuple[np.ndarray]:
+    '''
+    Evaluate the model and its jacobian to the fitted parameters.
+
+    Arguments
+    ----------
+    stacked : tuple
+        = (args, s, u0), the stacked template, see `sweep._stack_schemes`.
+    params : dict
+        The value of each parameter in FIT_PARAMETERS that is used.
+    observable : numpy.ndarray with shape (4,)
+        The observable as a linear function of (x, y, z, 1).
+    fit : tuple[str]
+        The parameters to have their jacobian computed.
+    jacobian : bool
+        If true, also return the jacobian.
+
+    Returns
+    ----------
+    y : numpy.ndarray with shape (n,)
+        The model for each value.
+    jac : numpy.ndarray with shape (n, len(fit))
+        The derivative of y to each fitted parameter.
+    '''
+    nominal, s, u0 = stacked
+    args = nominal.copy()
+    for name in ('d', 'G1', 'G2'):
+        if name in params:
+            args[PHY_ARG_NAMES.index(name)] = params[name]
+    args[:2] *= params.get('scale', 1.)
+    generator = bloch_generator(*args)
+    propagators = affine_propagator(generator, s)
+    n, m = s.shape
+    states = np.empty((n, m + 1, 4))
+    states[:, 0] = np.concatenate([u0, np.ones((n, 1))], axis=1)
+    for j in range(m):
+        states[:, j+1] = np.einsum('nij,nj->ni', propagators[:, j], states[:, j])
+    y = states[:, -1] @ observable
+    if not jacobian:
+        return y, None
+    costates = np.empty((n, m + 1, 4))
+    costates[:, -1] = observable
+    for j in range(m - 1, -1, -1):
+        costates[:, j] = np.einsum(
+            'ni,nij->nj', costates[:, j+1], propagators[:, j])
+    jac = np.empty((n, len(fit)))
+    for k, name in enumerate(fit):
+        if name == 'scale':
+            direction = (
+                nominal[0][..., None, None] * generator_derivative('I')
+                + nominal[1][..., None, None] * generator_derivative('Q'))
+        else:
+            direction = generator_derivative(name, args[3], args[4])
+        _, derivative = propagator_derivative(generator, direction, s)
+        jac[:, k] = np.einsum('nji,njik,njk->n',
+                              costates[:, 1:], derivative, states[:, :-1])
+    return y, jac
+
+def _fit_stacked(stacked: Tuple[np.ndarray], data: np.ndarray,
+                 p0, observable: str, bounds: Dict[str, Tuple[float]],
+                 sigma: np.ndarray) -> OptimizeResult:
+    """Fit the data by a stacked template, see `fit_bloch`."""
+    if isinstance(p0, OptimizeResult):
+        p0 = p0.params
+    fit = tuple(name for name in FIT_PARAMETERS if name in p0)
+    if len(fit) == 0:
+        raise ValueError(
+            f'The initial guess should contain some of {FIT_PARAMETERS}.'
+            ) from None
+    if observable not in OBSERVABLES:
+        raise ValueError(
+            f'The observable {observable} is not one of '
+            + f'{tuple(OBSERVABLES)}.') from None
+    observable = np.array(OBSERVABLES[observable], dtype=float)
+    data = np.asarray(data, dtype=float)
+    weight = 1. if sigma is None else 1 / np.asarray(sigma, dtype=float)
+    bounds = bounds or {}
+    lower = [bounds.get(name, (-np.inf, np.inf))[0] for name in fit]
+    upper = [bounds.get(name, (-np.inf, np.inf))[1] for name in fit]
+
+    def residual(p):
+        y, _ = _model(stacked, dict(zip(fit, p)), observable, fit)
+        return (y - data) * weight
+
+    def jacobian(p):
+        _, jac = _model(stacked, dict(zip(fit, p)), observable, fit, True)
+        return jac * np.reshape(weight, (-1, 1))
+
+    result = least_squares(
+        residual, [p0[name] for name in fit], jac=jacobian,
+        bounds=(lower, upper), x_scale='jac')
+    result.params = dict(zip(fit, map(float, result.x)))
+    result.model = residual(result.x) / weight + data
+    try:
+        dof = max(len(data) - len(fit), 1)
+        result.covariance = (np.linalg.inv(result.jac.T @ result.jac)
+                             * 2 * result.cost / dof)
+    except np.linalg.LinAlgError:
+        result.covariance = np.full((len(fit), len(fit)), np.inf)
+    return result
+
+def fit_bloch(template: Callable[[float], ExpScheme],
+              x: Iterable,
+              data: np.ndarray,
+              p0,
+              *,
+              observable: str = 'z',
+              bounds: Dict[str, Tuple[float]] = None,
+              sigma: np.ndarray = None) -> OptimizeResult:
+    '''
+    Fit measured data by a bloch simulation model.
+
+    Arguments
+    ----------
+    template : callable(value)
+        Return the experiment scheme for a value of x, with nominal
+        physical arguments. All physical arguments must be constant.
+    x : iterable
+        The swept values, e.g. the waiting times.
+    data : numpy.ndarray with shape (n,)
+        The measured observable for each value of x.
+    p0 : dict or scipy.optimize.OptimizeResult
+        The initial guess of the parameters to be fitted, the keys are
+        some of ('G1', 'G2', 'd', 'scale'). A previous fit result can be
+        given to warm start from its parameters.
+
+    Keyword Arguments
+    ----------
+    observable : str, optional
+        What the data measures, one of 'x', 'y', 'z' or 'p0', 'p1' for the
+        probability of |0> or |1>. (default is 'z')
+    bounds : dict, optional
+        The (min, max) bounds for some of the fitted parameters.
+    sigma : numpy.ndarray with shape (n,), optional
+        The uncertainty of the data, used to weight the residuals.
+
+    Returns
+    ----------
+    result : scipy.optimize.OptimizeResult
+        The fit result, see `scipy.optimize.least_squares`. In addition,
+        result.params is the dict of fitted parameters, result.model is the
+        fitted model for each value of x and result.covariance is the
+        covariance matrix of the fitted parameters.
+    '''
+    stacked = _compile_template(template, x)
+    return _fit_stacked(stacked, data, p0, observable, bounds, sigma)
+
+def fit_bloch_many(template: Callable[[float], ExpScheme],
+                   x: Iterable,
+                   datas: Iterable[np.ndarray],
+                   p0,
+                   *,
+                   observable: str = 'z',
+                   bounds: Dict[str, Tuple[float]] = None,
+                   workers: int = None) -> List[OptimizeResult]:
+    '''
+    Fit the measured data of many qubits in parallel.
+
+    The template is built once and shared by all qubits.
+
+    Arguments
+    ----------
+    template : callable(value)
+        Return the experiment scheme for a value of x, see `fit_bloch`.
+    x : iterable
+        The swept values, shared by all qubits.
+    datas : iterable of numpy.ndarray with shape (n,)
+        The measured data of each qubit.
+    p0 : dict, scipy.optimize.OptimizeResult or a list of them
+        The initial guess shared by all qubits, or one for each qubit.
+
+    Keyword Arguments
+    ----------
+    observable : str, optional
+        What the data measures, see `fit_bloch`. (default is 'z')
+    bounds : dict, optional
+        The (min, max) bounds for some of the fitted parameters.
+    workers : int, optional
+        The number of threads. (default is None, decided by
+        `concurrent.futures.ThreadPoolExecutor`)
+
+    Returns
+    ----------
+    results : list[scipy.optimize.OptimizeResult]
+        The fit result of each qubit, see `fit_bloch`.
+    '''
+    stacked = _compile_template(template, x)
+    datas = list(datas)
+    if not isinstance(p0, (list, tuple)):
+        p0 = [p0] * len(datas)
+    with ThreadPoolExecutor(workers) as executor:
+        futures = [
+            executor.submit(_fit_stacked, stacked, data, guess,
+                            observable, bounds, None)
+            for data, guess in zip(datas, p0)]
+        return [future.result() for future in futures]
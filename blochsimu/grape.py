@@ -0,0 +1,239 @@
+# -*- coding: utf-8 -*-
+"""Exact gradients and optimization of piecewise-constant pulse shapes.
+
+GRAPE (gradient ascent pulse engineering) optimizes the samples of
+piecewise-constant wave forms, such that the final position maximizes an
+objective. Each section is cut into slices where every physical argument is
+constant, so the final position is a product of exact propagators
+    (u_N, 1) = P_N ... P_2 P_1 (u_0, 1),
+see module `propagator`. The gradient of an objective f(u_N) to every sample
+is computed by the adjoint method, in one forward pass that stores the
+positions u_k and one backward pass that propagates the costate
+    lambda_k = P_k^T lambda_k+1,  lambda_N = df/du_N,
+then df/dtheta = lambda_k+1^T (dP_k/dtheta) u_k for the slice k that the
+sample theta controls. The cost is independent of the number of samples.
+
+Physical arguments given as `PiecewiseConstant` are the controls, other
+callables are evaluated at the middle of each slice.
+
+function
+----------
+grape_gradient
+grape
+"""
+
+import numpy as np
+from scipy.optimize import minimize, OptimizeResult
+from .expscheme import Section, ExpScheme
+from .waveform import PiecewiseConstant
+from .propagator import (PHY_ARG_NAMES, bloch_generator, generator_derivative,
+                         affine_propagator, propagator_derivative)
+from typing import Callable, Dict, List, Tuple
+__all__ = [
+    'grape_gradient',
+    'grape'
+]
+
+def _objective_of(objective) -> Callable:
+    """Return a callable(u) -> (value, gradient) for the objective."""
+    if callable(objective):
+        return objective
+    target = np.asarray(objective, dtype=float)
+    if target.shape != (3,):
+        raise ValueError(
+            'The objective should be a callable or a target position '
+            + 'with length of 3.') from None
+    return lambda u: (float(target @ u), target)
+
+def _section_slices(section: Section, controls: Tuple[str]) -> tuple:
+    '''
+    Cut a section into slices with constant physical arguments.
+
+    Arguments
+    ----------
+    section : Section
+        The section.
+    controls : tuple[str]
+        The names of physical arguments that are optimized.
+
+    Returns
+    ----------
+    durations : numpy.ndarray with shape (k,)
+        The duration of each slice.
+    args : tuple
+        = (I, Q, d, z0, G1, G2), each is numpy.ndarray with shape (k,).
+    links : list
+        A list of (name, waveform, slice_index, sample_index), telling
+        that the sample_index-th sample of waveform sets the physical
+        argument name in the slice_index-th slices.
+    '''
+    edges = [0., section.s]
+    for name in PHY_ARG_NAMES:
+        arg = section.phy_args[name]
+        if isinstance(arg, PiecewiseConstant):
+            edges.extend(arg.t_slice * np.arange(1, len(arg.samples) + 1))
+    edges = np.unique(np.clip(edges, 0, section.s))
+    edges = edges[np.append(True, np.diff(edges) > 1e-12 * section.s)]
+    edges[-1] = section.s
+    mid = (edges[:-1] + edges[1:]) / 2
+    args = []
+    links = []
+    for name in PHY_ARG_NAMES:
+        arg = section.phy_args[name]
+        if not callable(arg):
+            args.append(np.full(len(mid), float(arg)))
+            continue
+        args.append(np.array([arg(t) for t in mid], dtype=float))
+        if name in controls and isinstance(arg, PiecewiseConstant):
+            inside = np.nonzero(mid <= arg.s)[0]
+            sample_index = np.minimum(
+                (mid[inside] / arg.t_slice).astype(int), len(arg.samples) - 1)
+            links.append((name, arg, inside, sample_index))
+    return np.diff(edges), tuple(args), links
+
+def grape_gradient(expe: ExpScheme, objective,
+                   *,
+                   controls: Tuple[str] = ('I', 'Q')
+                   ) -> Tuple[float, Dict[PiecewiseConstant, np.ndarray]]:
+    '''
+    Compute the objective and its exact gradient to every control sample.
+
+    Arguments
+    ----------
+    expe : ExpScheme object
+        The experiment scheme.
+    objective : array_like with length 3 or callable(u)
+        The objective of the final position u. If a target position is
+        given, the objective is its dot product with u. If a callable is
+        given, it should return (value, gradient) with gradient the
+        derivative of the value to u.
+
+    Keyword Argument
+    ----------
+    controls : tuple[str], optional
+        The physical arguments to be optimized, those are `PiecewiseConstant`
+        will have their gradient computed. (default is ('I', 'Q'))
+
+    Returns
+    ----------
+    value : float
+        The objective of the final position.
+    gradients : dict
+        Map each `PiecewiseConstant` control to the gradient of the
+        objective to its samples, with the same shape as its samples.
+    '''
+    if expe.carrier is not None and expe.counter_rotating != 'rwa':
+        raise ValueError(
+            'The gradient is only available in the rotating wave '
+            + 'approximation.') from None
+    value_and_grad = _objective_of(objective)
+    # forward pass
+    u = np.append(expe.u0, 1.)
+    passes = []
+    for section in expe.sequence:
+        durations, args, links = _section_slices(section, controls)
+        generator = bloch_generator(*args)
+        propagators = affine_propagator(generator, durations)
+        derivatives = []
+        for name, waveform, inside, sample_index in links:
+            direction = generator_derivative(
+                name, args[3][inside], args[4][inside])
+            _, derivative = propagator_derivative(
+                generator[inside], direction, durations[inside])
+            derivatives.append((waveform, inside, sample_index, derivative))
+        states = np.empty((len(durations) + 1, 4))
+        states[0] = u
+        for k, propagator in enumerate(propagators):
+            states[k+1] = propagator @ states[k]
+        u = states[-1]
+        passes.append((propagators, derivatives, states))
+    value, grad_u = value_and_grad(u[:3])
+    # backward pass
+    costate = np.append(grad_u, 0.)
+    gradients = {}
+    for propagators, derivatives, states in reversed(passes):
+        costates = np.empty((len(propagators) + 1, 4))
+        costates[-1] = costate
+        for k in range(len(propagators) - 1, -1, -1):
+            costates[k] = costates[k+1] @ propagators[k]
+        costate = costates[0]
+        for waveform, inside, sample_index, derivative in derivatives:
+            contribution = np.einsum(
+                'ki,kij,kj->k', costates[inside+1], derivative, states[inside])
+            gradient = gradients.setdefault(
+                waveform, np.zeros_like(waveform.samples))
+            np.add.at(gradient, sample_index, contribution)
+    return value, gradients
+
+def grape(expe: ExpScheme, objective,
+          *,
+          controls: Tuple[str] = ('I', 'Q'),
+          bounds: Tuple[float] = None,
+          maxiter: int = 200,
+          tol: float = None) -> OptimizeResult:
+    '''
+    Optimize the control samples to maximize the objective.
+
+    The samples of every `PiecewiseConstant` control are updated in place,
+    by the L-BFGS-B method with exact gradients from `grape_gradient`.
+
+    Arguments
+    ----------
+    expe : ExpScheme object
+        The experiment scheme, with some physical arguments given as
+        `PiecewiseConstant` to be the initial guess.
+    objective : array_like with length 3 or callable(u)
+        The objective of the final position, see `grape_gradient`.
+
+    Keyword Arguments
+    ----------
+    controls : tuple[str], optional
+        The physical arguments to be optimized. (default is ('I', 'Q'))
+    bounds : tuple[float], optional
+        = (min, max), the bounds for every sample, e.g. the amplitude
+        limit of the instrument. (default is None, unbounded)
+    maxiter : int, optional
+        The maximum number of iterations. (default is 200)
+    tol : float, optional
+        The tolerance for termination, see `scipy.optimize.minimize`.
+
+    Returns
+    ----------
+    result : scipy.optimize.OptimizeResult
+        The optimization result, result.fun is the negative objective,
+        result.x is the optimized samples and result.waveforms is the
+        list of optimized `PiecewiseConstant`.
+    '''
+    waveforms: List[PiecewiseConstant] = []
+    for section in expe.sequence:
+        for name in controls:
+            arg = section.phy_args[name]
+            if (isinstance(arg, PiecewiseConstant) and
+                all(arg is not waveform for waveform in waveforms)):
+                waveforms.append(arg)
+    if len(waveforms) == 0:
+        raise ValueError(
+            'There is no PiecewiseConstant control to be optimized.') from None
+    splits = np.cumsum([len(waveform.samples) for waveform in waveforms])[:-1]
+    # samples are rates, optimize the dimensionless sample * total duration
+    scale = sum(section.s for section in expe.sequence)
+
+    def cost(x):
+        for waveform, samples in zip(waveforms, np.split(x / scale, splits)):
+            waveform.samples[:] = samples
+        value, gradients = grape_gradient(expe, objective, controls=controls)
+        gradient = np.concatenate([
+            gradients.get(waveform, np.zeros_like(waveform.samples))
+            for waveform in waveforms])
+        return -value, -gradient / scale
+
+    x0 = np.concatenate([waveform.samples for waveform in waveforms]) * scale
+    if bounds is not None:
+        bounds = [(bounds[0] * scale, bounds[1] * scale)] * len(x0)
+    result = minimize(
+        cost, x0, jac=True, method='L-BFGS-B', tol=tol,
+        bounds=bounds, options={'maxiter': maxiter})
+    cost(result.x)
+    result.x = result.x / scale
+    result.waveforms = waveforms
+    return result
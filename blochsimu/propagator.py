@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+"""Exact propagators of the bloch equation with constant physical arguments.
+
+When the physical arguments are constant, the bloch equation
+ d  / x \   / -G2  -d   I\ / x \   /   0   \
+----| y | = |  d  -G2  -Q| | y | + |   0   |
+ dt \ z /   \ -I   Q  -G1/ \ z /   \ G1*z0 /
+is an affine linear equation. By augmenting u to (x, y, z, 1), it becomes
+d(u, 1)/dt = G (u, 1) with the 4x4 generator
+    / -G2  -d   I    0   \
+G = |  d  -G2  -Q    0   |
+    | -I   Q  -G1  G1*z0 |
+    \  0   0    0    0   /
+whose solution after a duration s is exactly (u(s), 1) = expm(G*s) (u(0), 1).
+The 4x4 matrix P = expm(G*s) is the propagator, it maps any initial position
+to the final one, and propagators of consecutive durations compose by matrix
+multiplication.
+
+All functions broadcast over leading axes, so a batch of propagators are
+computed in a single vectorized call. The matrix exponential is computed by
+the scaling and squaring method with the [13/13] Pade approximant (Higham,
+2005), vectorized over the batch by numpy.
+
+function
+----------
+expm
+bloch_generator
+generator_derivative
+affine_propagator
+propagator_derivative
+"""
+
+import numpy as np
+__all__ = [
+    'expm',
+    'bloch_generator',
+    'generator_derivative',
+    'affine_propagator',
+    'propagator_derivative'
+]
+
+PHY_ARG_NAMES = ('I', 'Q', 'd', 'z0', 'G1', 'G2')
+
+# coefficients of the [13/13] Pade approximant and its maximal 1-norm
+_PADE13 = (64764752532480000., 32382376266240000., 7771770303897600.,
+           1187353796428800., 129060195264000., 10559470521600.,
+           670442572800., 33522128640., 1323241920., 40840800., 960960.,
+           16380., 182., 1.)
+_THETA13 = 5.371920351148152
+
+def expm(A: np.ndarray) -> np.ndarray:
+    """Return the matrix exponential of a batch of square matrices.
+
+    Argument
+    ----------
+    A : numpy.ndarray with shape (..., n, n)
+        The matrices.
+
+    Returns
+    ----------
+    expA : numpy.ndarray with shape (..., n, n)
+        The matrix exponential of each matrix.
+    """
+    A = np.asarray(A, dtype=float)
+    norm = np.abs(A).sum(axis=-2).max(axis=-1, initial=0.)
+    with np.errstate(divide='ignore'):
+        squarings = np.maximum(
+            np.ceil(np.log2(norm / _THETA13)), 0).astype(int)
+    A = A / (2.**squarings)[..., None, None]
+    b = _PADE13
+    ident = np.broadcast_to(np.eye(A.shape[-1]), A.shape)
+    A2 = A @ A
+    A4 = A2 @ A2
+    A6 = A4 @ A2
+    U = A @ (A6 @ (b[13]*A6 + b[11]*A4 + b[9]*A2)
+             + b[7]*A6 + b[5]*A4 + b[3]*A2 + b[1]*ident)
+    V = (A6 @ (b[12]*A6 + b[10]*A4 + b[8]*A2)
+         + b[6]*A6 + b[4]*A4 + b[2]*A2 + b[0]*ident)
+    expA = np.linalg.solve(V - U, V + U)
+    for k in range(squarings.max(initial=0)):
+        square = squarings > k
+        expA[square] = expA[square] @ expA[square]
+    return expA
+
+def bloch_generator(I, Q, d, z0, G1, G2) -> np.ndarray:
+    """Return the augmented 4x4 generator of the bloch equation.
+
+    Arguments
+    ----------
+    I, Q, d, z0, G1, G2 : float or numpy.ndarray
+        The constant physical arguments, arrays are broadcast together.
+
+    Returns
+    ----------
+    generator : numpy.ndarray with shape (..., 4, 4)
+        The generator, the leading axes are the broadcast shape of inputs.
+    """
+    I, Q, d, z0, G1, G2 = np.broadcast_arrays(
+        *(np.asarray(arg, dtype=float) for arg in (I, Q, d, z0, G1, G2)))
+    generator = np.zeros(I.shape + (4, 4))
+    generator[..., 0, 0] = -G2
+    generator[..., 0, 1] = -d
+    generator[..., 0, 2] = I
+    generator[..., 1, 0] = d
+    generator[..., 1, 1] = -G2
+    generator[..., 1, 2] = -Q
+    generator[..., 2, 0] = -I
+    generator[..., 2, 1] = Q
+    generator[..., 2, 2] = -G1
+    generator[..., 2, 3] = G1 * z0
+    return generator
+
+def generator_derivative(name: str, z0=1.0, G1=0.0) -> np.ndarray:
+    """Return the derivative of the generator to a physical argument.
+
+    Arguments
+    ----------
+    name : str
+        The physical argument, one of (I, Q, d, z0, G1, G2).
+    z0, G1 : float or numpy.ndarray, optional
+        The generator is bilinear in G1 and z0, so the derivative to one of
+        them depends on the other.
+
+    Returns
+    ----------
+    derivative : numpy.ndarray with shape (..., 4, 4)
+        The derivative, the leading axes are the shape of z0 or G1.
+    """
+    if name not in PHY_ARG_NAMES:
+        raise ValueError(
+            f'The physical argument {name} is not one of '
+            + f'{PHY_ARG_NAMES}.') from None
+    z0, G1 = np.broadcast_arrays(
+        np.asarray(z0, dtype=float), np.asarray(G1, dtype=float))
+    derivative = np.zeros(z0.shape + (4, 4))
+    if name == 'I':
+        derivative[..., 0, 2] = 1
+        derivative[..., 2, 0] = -1
+    elif name == 'Q':
+        derivative[..., 1, 2] = -1
+        derivative[..., 2, 1] = 1
+    elif name == 'd':
+        derivative[..., 0, 1] = -1
+        derivative[..., 1, 0] = 1
+    elif name == 'z0':
+        derivative[..., 2, 3] = G1
+    elif name == 'G1':
+        derivative[..., 2, 2] = -1
+        derivative[..., 2, 3] = z0
+    else: # is G2
+        derivative[..., 0, 0] = -1
+        derivative[..., 1, 1] = -1
+    return derivative
+
+def affine_propagator(generator: np.ndarray, s) -> np.ndarray:
+    """Return the propagator expm(generator * s).
+
+    Arguments
+    ----------
+    generator : numpy.ndarray with shape (..., 4, 4)
+        The generator, see `bloch_generator`.
+    s : float or numpy.ndarray
+        The duration, broadcast with the leading axes of generator.
+
+    Returns
+    ----------
+    propagator : numpy.ndarray with shape (..., 4, 4)
+        The propagator, P[..., :3, :3] is the linear part and P[..., :3, 3]
+        is the affine part.
+    """
+    s = np.asarray(s, dtype=float)[..., None, None]
+    return expm(generator * s)
+
+def propagator_derivative(generator: np.ndarray,
+                          direction: np.ndarray, s) -> np.ndarray:
+    """Return the derivative of the propagator along a generator direction.
+
+    The Frechet derivative of expm at X = generator*s along E = direction*s
+    is the upper right block of expm([[X, E], [0, X]]), which is exact and
+    vectorized over a batch.
+
+    Arguments
+    ----------
+    generator : numpy.ndarray with shape (..., 4, 4)
+        The generator, see `bloch_generator`.
+    direction : numpy.ndarray with shape (..., 4, 4)
+        The derivative of the generator, see `generator_derivative`.
+    s : float or numpy.ndarray
+        The duration, broadcast with the leading axes of generator.
+
+    Returns
+    ----------
+    propagator : numpy.ndarray with shape (..., 4, 4)
+        The propagator expm(generator * s).
+    derivative : numpy.ndarray with shape (..., 4, 4)
+        The derivative of the propagator.
+    """
+    generator, direction = np.broadcast_arrays(generator, direction)
+    s = np.asarray(s, dtype=float)[..., None, None]
+    block = np.zeros(np.broadcast_shapes(generator.shape[:-2], s.shape[:-2])
+                     + (8, 8))
+    block[..., :4, :4] = generator * s
+    block[..., :4, 4:] = direction * s
+    block[..., 4:, 4:] = generator * s
+    block = expm(block)
+    return block[..., :4, :4], block[..., :4, 4:]
@@ -0,0 +1,320 @@
+# -*- coding: utf-8 -*-
+"""Randomized benchmarking with single-qubit Clifford gates.
+
+Randomized benchmarking applies random sequences of Clifford gates followed
+by the recovery gate, which inverts the whole sequence, and measures the
+probability to survive in the initial state. The survival decays with the
+sequence length m as A p^m + B, and the error per Clifford is (1 - p) / 2.
+
+Each of the 24 single-qubit Clifford gates is a sequence of the generators
+X90, -X90, Y90, -Y90, X180 and Y180, 44 generators in total, the identity
+has none. A rotation about x is a pulse of Q, a rotation about y is a pulse
+of I, see module `blochnumint`. The generators are given as sections, square
+pulses of an amplitude by default, and the physical arguments not given by
+them are the default ones of a template experiment scheme, including the
+decay.
+
+The propagator of each generator is computed once (see module `seqcompile`)
+and composed into the 24 Clifford propagators. Then all sequences of all
+lengths are applied in a batch, a step of the batch applies one Clifford
+propagator to every sequence at once :
+
+    rb = bs.CliffordRB(expe, amplitude=2*np.pi*10e+6)
+    lengths = [1, 10, 50, 100, 200, 500]
+    survival = rb.survival(lengths, n_seq=200, seed=1234)
+    A, p, B = bs.fit_rb_decay(lengths, survival.mean(axis=1))
+
+Class
+----------
+CliffordRB
+
+function
+----------
+fit_rb_decay
+"""
+
+import numpy as np
+from scipy.optimize import curve_fit
+from .expscheme import Section, ExpScheme
+from .seqcompile import compile_scheme
+from typing import Dict, List, Sequence, Tuple
+__all__ = [
+    'CliffordRB',
+    'fit_rb_decay'
+]
+
+GENERATORS = ('X90', '-X90', 'Y90', '-Y90', 'X180', 'Y180')
+
+# the 24 Clifford gates, each by the generators in the order of application
+CLIFFORDS = (
+    # Pauli gates
+    (), ('X180',), ('Y180',), ('X180', 'Y180'),
+    # 2pi/3 rotations
+    ('X90', 'Y90'), ('X90', '-Y90'), ('-X90', 'Y90'), ('-X90', '-Y90'),
+    ('Y90', 'X90'), ('Y90', '-X90'), ('-Y90', 'X90'), ('-Y90', '-X90'),
+    # pi/2 rotations
+    ('X90',), ('-X90',), ('Y90',), ('-Y90',),
+    ('-X90', 'Y90', 'X90'), ('-X90', '-Y90', 'X90'),
+    # Hadamard-like gates
+    ('X180', 'Y90'), ('X180', '-Y90'), ('Y180', 'X90'), ('Y180', '-X90'),
+    ('X90', 'Y90', 'X90'), ('-X90', 'Y90', '-X90'),
+)
+
+def _rotation(name: str) -> np.ndarray:
+    """Return the ideal 3x3 rotation of a generator on the bloch sphere."""
+    angle = np.pi / 2 if name.endswith('90') else np.pi
+    if name.startswith('-'):
+        angle = -angle
+    c, s = np.cos(angle), np.sin(angle)
+    if 'X' in name:
+        return np.array([[1, 0, 0], [0, c, -s], [0, s, c]])
+    return np.array([[c, 0, s], [0, 1, 0], [-s, 0, c]])
+
+def _compose(matrices: Dict[str, np.ndarray], names: Sequence[str],
+             size: int) -> np.ndarray:
+    """Return the product of matrices applied in the order of names."""
+    product = np.eye(size)
+    for name in names:
+        product = matrices[name] @ product
+    return product
+
+class CliffordRB:
+    """Simulate randomized benchmarking by precomputed Clifford propagators.
+
+    Instance variables
+    ----------
+    expe : ExpScheme
+        The template experiment scheme, whose default physical arguments
+        and initial position are used.
+    generators : dict
+        generators[name] is a list of (s, phy_args), the sections that
+        implement the generator.
+    propagators : numpy.ndarray with shape (25, 4, 4)
+        The affine propagator of each Clifford gate, the last one is the
+        identity used to pad sequences.
+    rotations : numpy.ndarray with shape (24, 3, 3)
+        The ideal rotation of each Clifford gate.
+    table : numpy.ndarray with shape (24, 24)
+        table[a, b] is the Clifford gate equal to b then a.
+    inverse : numpy.ndarray with shape (24,)
+        The inverse of each Clifford gate.
+
+    Public methods
+    ----------
+    clifford_sections -- the sections that implement a Clifford gate.
+    sequences -- draw random sequences with the recovery gates.
+    final_states -- apply sequences in a batch.
+    survival -- the survival probability of random sequences.
+    """
+
+    def __init__(self, expe: ExpScheme, amplitude: float = None,
+                 *,
+                 generators: Dict[str, List[tuple]] = None,
+                 gap: float = 0.) -> None:
+        """Set the generators and precompute the Clifford propagators.
+
+        Arguments
+        ----------
+        expe : ExpScheme object
+            The template experiment scheme, its sequence is not used.
+        amplitude : float, optional
+            The amplitude of square pulses of I and Q, in rad/s, a 90
+            degree rotation lasts pi/2/amplitude. Required if generators
+            are not given.
+
+        Keyword Arguments
+        ----------
+        generators : dict, optional
+            generators[name] is a list of (s, phy_args) for each name of
+            X90, -X90, Y90, -Y90, X180 and Y180, e.g. gaussian pulses
+            {'X90': [(t_pulse, {'Q': pulse})], ...}. (default is None,
+            square pulses of the amplitude)
+        gap : float, optional
+            The idle time after each generator. (default is 0)
+        """
+        if expe.carrier is not None and expe.counter_rotating == 'exact':
+            raise ValueError(
+                "The counter_rotating 'exact' depends on the absolute time, "
+                + 'gates have no fixed propagator.') from None
+        if generators is None:
+            if amplitude is None:
+                raise ValueError(
+                    'Either amplitude or generators should be given.'
+                    ) from None
+            generators = {}
+            for name in GENERATORS:
+                angle = np.pi / 2 if name.endswith('90') else np.pi
+                sign = -1. if name.startswith('-') else 1.
+                channel = 'Q' if 'X' in name else 'I'
+                generators[name] = [(angle / amplitude,
+                                     {channel: sign * amplitude})]
+        missing = set(GENERATORS) - set(generators)
+        if missing:
+            raise ValueError(
+                f'The generators {sorted(missing)} are not given.') from None
+        if gap > 0:
+            generators = {name: list(sections) + [(gap, {})]
+                          for name, sections in generators.items()}
+        self.expe = expe
+        self.generators = generators
+        # propagators of generators, then of Clifford gates
+        generator_propagators = {
+            name: compile_scheme(self._scheme(generators[name])).propagator()
+            for name in GENERATORS}
+        self.propagators = np.array(
+            [_compose(generator_propagators, names, 4) for names in CLIFFORDS]
+            + [np.eye(4)])
+        rotations = {name: _rotation(name) for name in GENERATORS}
+        self.rotations = np.array(
+            [_compose(rotations, names, 3) for names in CLIFFORDS])
+        # the ideal rotations are signed permutations, compare them exactly
+        keys = {tuple(np.rint(R).astype(int).ravel()): index
+                for index, R in enumerate(self.rotations)}
+        self.table = np.array(
+            [[keys[tuple(np.rint(Ra @ Rb).astype(int).ravel())]
+              for Rb in self.rotations] for Ra in self.rotations])
+        self.inverse = np.array(
+            [keys[tuple(np.rint(R.T).astype(int).ravel())]
+             for R in self.rotations])
+
+    def _scheme(self, sections: List[tuple]) -> ExpScheme:
+        """Return a copy of the template with the sections."""
+        defaults = self.expe.default_phy_args
+        expe = ExpScheme(u0=tuple(self.expe.u0), **defaults,
+                         carrier=self.expe.carrier,
+                         counter_rotating=self.expe.counter_rotating)
+        expe.sequence = [Section(s, **dict(phy_args))
+                         for s, phy_args in sections]
+        return expe
+
+    def clifford_sections(self, index: int) -> List[Section]:
+        '''
+        Return the sections that implement a Clifford gate.
+
+        Argument
+        ----------
+        index : int
+            The index of the Clifford gate, 0 to 23, see `CLIFFORDS`.
+
+        Returns
+        ----------
+        sections : list[Section]
+            New sections, to be put into the sequence of an experiment
+            scheme with the default physical arguments of the template.
+        '''
+        return [Section(s, **dict(phy_args))
+                for name in CLIFFORDS[index]
+                for s, phy_args in self.generators[name]]
+
+    def sequences(self, lengths: Sequence[int], n_seq: int,
+                  seed=None) -> np.ndarray:
+        '''
+        Draw random Clifford sequences with the recovery gates.
+
+        Arguments
+        ----------
+        lengths : sequence of int
+            The numbers of random Clifford gates.
+        n_seq : int
+            The number of random sequences for each length.
+        seed : None, int or numpy.random.SeedSequence, optional
+            The seed of the random generator. (default is None)
+
+        Returns
+        ----------
+        sequences : numpy.ndarray with shape (len(lengths), n_seq, M+1)
+            The indices of the Clifford gates in the order of application,
+            M is the maximal length. Shorter sequences are padded at the
+            start by 24, the identity, and each ends with its recovery gate.
+        '''
+        lengths = np.asarray(lengths, dtype=int)
+        if lengths.ndim != 1 or np.any(lengths < 0):
+            raise ValueError(
+                'The lengths should be non-negative integers.') from None
+        rng = np.random.default_rng(seed)
+        m_max = int(lengths.max(initial=0))
+        gates = rng.integers(0, 24, (len(lengths), n_seq, m_max))
+        padding = np.arange(m_max) < (m_max - lengths)[:, None, None]
+        gates[np.broadcast_to(padding, gates.shape)] = 24
+        # the ideal net gate, the padding is skipped
+        net = np.zeros((len(lengths), n_seq), dtype=int)
+        for k in range(m_max):
+            gate = gates[:, :, k]
+            real = gate < 24
+            net[real] = self.table[gate[real], net[real]]
+        recovery = self.inverse[net]
+        return np.concatenate([gates, recovery[..., None]], axis=-1)
+
+    def final_states(self, sequences: np.ndarray) -> np.ndarray:
+        '''
+        Apply Clifford sequences to the initial position in a batch.
+
+        Argument
+        ----------
+        sequences : numpy.ndarray of int with shape (..., M)
+            The indices of the Clifford gates in the order of application,
+            24 is the identity, see `sequences`.
+
+        Returns
+        ----------
+        u_end : numpy.ndarray with shape (..., 3)
+            The final position (x, y, z) of each sequence.
+        '''
+        sequences = np.asarray(sequences, dtype=int)
+        flat = sequences.reshape(-1, sequences.shape[-1])
+        u = np.tile(np.append(self.expe.u0, 1.), (len(flat), 1))
+        for k in range(flat.shape[1]):
+            u = np.einsum('nij,nj->ni', self.propagators[flat[:, k]], u)
+        return u[:, :3].reshape(sequences.shape[:-1] + (3,))
+
+    def survival(self, lengths: Sequence[int], n_seq: int,
+                 seed=None) -> np.ndarray:
+        '''
+        Return the survival probability of random Clifford sequences.
+
+        The survival probability is the probability to measure the initial
+        position, (1 + u_end . u0) / 2 for a pure initial position u0.
+
+        Arguments
+        ----------
+        lengths : sequence of int
+            The numbers of random Clifford gates.
+        n_seq : int
+            The number of random sequences for each length.
+        seed : None, int or numpy.random.SeedSequence, optional
+            The seed of the random generator. (default is None)
+
+        Returns
+        ----------
+        survival : numpy.ndarray with shape (len(lengths), n_seq)
+            The survival probability of each sequence.
+        '''
+        u_end = self.final_states(self.sequences(lengths, n_seq, seed))
+        return (1 + u_end @ self.expe.u0) / 2
+
+    def __repr__(self):
+        return "A single-qubit Clifford randomized benchmarking simulator"
+
+def fit_rb_decay(lengths: Sequence[int],
+                 survival: Sequence[float]) -> Tuple[float]:
+    '''
+    Fit the mean survival probability by A p^m + B.
+
+    Arguments
+    ----------
+    lengths : sequence of int
+        The numbers of random Clifford gates m.
+    survival : sequence of float
+        The mean survival probability at each length.
+
+    Returns
+    ----------
+    A, p, B : float
+        The fitted parameters, the error per Clifford is (1 - p) / 2.
+    '''
+    lengths = np.asarray(lengths, dtype=float)
+    survival = np.asarray(survival, dtype=float)
+    model = lambda m, A, p, B: A * p**m + B
+    (A, p, B), _ = curve_fit(model, lengths, survival, p0=(0.5, 0.99, 0.5),
+                             bounds=([-1, 0, -1], [2, 1, 2]))
+    return float(A), float(p), float(B)
@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+"""Simulate projective measurement shots of the final positions.
+
+A projective measurement along z gives the outcome 1 (the state |1>) with
+probability p1 = (1 - z) / 2. Repeating the measurement for many shots, the
+number of outcome 1 follows a binomial distribution, which is sampled directly
+for all points at once instead of drawing each shot.
+
+Imperfect state preparation and measurement (SPAM) are modelled by :
+
+  * prep_error -- the probability that the qubit is prepared in the opposite
+    state. Its outcome is taken as flipped, which is exact when the sequence
+    has no decay, since the evolution then maps -u0 to -u.
+  * assignment -- the 2x2 assignment matrix, assignment[i, j] is the
+    probability to read outcome i when the qubit is in state j.
+
+The positions are those returned by `sweep`, with shape (..., 3). For a
+solution u_sol of `blochsolve`, use u_sol[1:4].T to measure at every sampling
+time.
+
+Random numbers are drawn from independent streams spawned from one seed, one
+stream for each chunk of points. So the result only depends on the seed,
+regardless of the number of workers.
+
+function
+----------
+rng_streams
+measurement_probability
+sample_shots
+"""
+
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+__all__ = [
+    'rng_streams',
+    'measurement_probability',
+    'sample_shots'
+]
+
+def rng_streams(seed, n: int) -> List[np.random.Generator]:
+    """Return n independent random generators spawned from a seed.
+
+    Arguments
+    ----------
+    seed : None, int or numpy.random.SeedSequence
+        The root seed, None takes fresh entropy from the OS.
+    n : int
+        The number of streams, e.g. one for each worker.
+
+    Returns
+    ----------
+    generators : list[numpy.random.Generator]
+        The independent random generators.
+    """
+    if not isinstance(seed, np.random.SeedSequence):
+        seed = np.random.SeedSequence(seed)
+    return [np.random.default_rng(child) for child in seed.spawn(n)]
+
+def measurement_probability(u: np.ndarray,
+                            *,
+                            assignment: np.ndarray = None,
+                            prep_error: float = 0.) -> np.ndarray:
+    """Return the probability to read outcome 1.
+
+    Arguments
+    ----------
+    u : numpy.ndarray with shape (..., 3)
+        The positions (x, y, z) to be measured.
+
+    Keyword Arguments
+    ----------
+    assignment : numpy.ndarray with shape (2, 2), optional
+        The assignment matrix, assignment[i, j] is the probability to read
+        outcome i when the qubit is in state j. (default is None, perfect)
+    prep_error : float, optional
+        The probability of preparing the opposite state. (default is 0)
+
+    Returns
+    ----------
+    p1 : numpy.ndarray with shape (...)
+        The probability to read outcome 1 for each position.
+    """
+    u = np.asarray(u, dtype=float)
+    if u.shape[-1:] != (3,):
+        raise ValueError(
+            f'The shape of u is {u.shape}, it should be (..., 3).') from None
+    p1 = np.clip((1 - u[..., 2]) / 2, 0, 1)
+    if prep_error:
+        p1 = (1 - prep_error) * p1 + prep_error * (1 - p1)
+    if assignment is not None:
+        assignment = np.asarray(assignment, dtype=float)
+        if assignment.shape != (2, 2):
+            raise ValueError(
+                'The assignment matrix should have shape (2, 2).') from None
+        p1 = assignment[1, 0] * (1 - p1) + assignment[1, 1] * p1
+    return np.clip(p1, 0, 1)
+
+def sample_shots(u: np.ndarray,
+                 shots,
+                 *,
+                 assignment: np.ndarray = None,
+                 prep_error: float = 0.,
+                 seed=None,
+                 workers: int = None,
+                 chunk_size: int = 65536) -> np.ndarray:
+    """Sample the number of outcome 1 among the shots for every position.
+
+    Arguments
+    ----------
+    u : numpy.ndarray with shape (..., 3)
+        The positions (x, y, z) to be measured.
+    shots : int or numpy.ndarray with shape (...)
+        The number of shots for each position.
+
+    Keyword Arguments
+    ----------
+    assignment : numpy.ndarray with shape (2, 2), optional
+        The assignment matrix, see `measurement_probability`.
+    prep_error : float, optional
+        The probability of preparing the opposite state. (default is 0)
+    seed : None, int or numpy.random.SeedSequence, optional
+        The root seed of the random streams. (default is None)
+    workers : int, optional
+        The number of threads to sample the chunks. (default is None,
+        sample in this thread)
+    chunk_size : int, optional
+        The number of positions per chunk, each chunk has its own random
+        stream. (default is 65536)
+
+    Returns
+    ----------
+    counts : numpy.ndarray with shape (...)
+        The number of outcome 1 for each position.
+    """
+    p1 = measurement_probability(
+        u, assignment=assignment, prep_error=prep_error)
+    shots = np.broadcast_to(np.asarray(shots, dtype=np.int64), p1.shape)
+    p1, shots = p1.ravel(), shots.ravel()
+    counts = np.empty(p1.shape, dtype=np.int64)
+    starts = range(0, len(p1), chunk_size)
+    generators = rng_streams(seed, len(starts))
+
+    def sample_chunk(start, generator):
+        stop = start + chunk_size
+        counts[start:stop] = generator.binomial(shots[start:stop], p1[start:stop])
+
+    if workers is None:
+        for start, generator in zip(starts, generators):
+            sample_chunk(start, generator)
+    else:
+        with ThreadPoolExecutor(workers) as executor:
+            list(executor.map(sample_chunk, starts, generators))
+    return counts.reshape(np.shape(u)[:-1])
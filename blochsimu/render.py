@@ -0,0 +1,303 @@
+# -*- coding: utf-8 -*-
+"""Stateless plotting on explicit figures and axes, without pyplot.
+
+`blochdrawer` and `ExpScheme.plot_phy_arg` store the figure and axes they
+create, and create them by `matplotlib.pyplot`, whose global state is shared
+by all threads. The functions here keep no state, they draw on the axes they
+are given, or on a new `matplotlib.figure.Figure` which is not managed by
+pyplot, and return the figure and axes. Hence many plots can be rendered in
+parallel threads or processes, and saved by `fig.savefig` :
+
+    fig, ax = bs.render.plot_trajectory(u_sol, sepe_N=10)
+    fig.savefig('trajectory.png')
+
+To display a figure of this module in a pyplot window, pass axes created by
+pyplot instead :
+
+    fig = plt.figure()
+    bs.render.plot_trajectory(u_sol, ax=fig.add_subplot(projection='3d'))
+    plt.show()
+
+function
+----------
+draw_sphere
+bloch_axes
+plot_trajectory
+animate_trajectory
+phy_arg_samples
+plot_phy_arg
+"""
+
+import numpy as np
+import matplotlib.animation
+from matplotlib.figure import Figure
+from .waveform import InterpolationTable
+from typing import Tuple
+__all__ = [
+    'draw_sphere',
+    'bloch_axes',
+    'plot_trajectory',
+    'animate_trajectory',
+    'phy_arg_samples',
+    'plot_phy_arg'
+]
+
+def _check_u(u: np.ndarray) -> np.ndarray:
+    """Check the solution u with shape (4, N), return the positions."""
+    if type(u) is not np.ndarray:
+        raise TypeError(
+            f'The input for u is not numpy.ndarray') from None
+    if not u.shape[0] == 4:
+        raise TypeError(
+            f'The shape of u is {u.shape}, it should be (4, N)') from None
+    return u[1:4, :]
+
+def draw_sphere(ax) -> None:
+    """Draw a bloch sphere with its axes and labels on 3-D axes.
+
+    Argument
+    ----------
+    ax : mpl_toolkits.mplot3d.axes3d.Axes3D
+        The axes to draw on.
+    """
+    ax.set(title = 'Qubit on bloch sphere')
+    ax.set(xlim3d=(-1.1, 1.1), ylim3d=(-1.1, 1.1),
+                zlim3d=(-1.1, 1.1))
+    # plot spherical coordinate curves
+    u, v = np.mgrid[0 : 2*np.pi : 200j, 0 : np.pi : 100j]
+    x = np.cos(u) * np.sin(v)
+    y = np.sin(u) * np.sin(v)
+    z = np.cos(v)
+    ax.plot_wireframe(x, y, z, rstride=18, cstride=18, linewidth=1, color='tan')
+    # add axis and labeling
+    ax.quiver(-1.3,  0,  0, 2.6, 0, 0, color = 'k', arrow_length_ratio = 0.05) # x-axis
+    ax.quiver( 0, -1.3,  0, 0, 2.6, 0, color = 'k', arrow_length_ratio = 0.05) # y-axis
+    ax.quiver( 0,  0, -1.3, 0, 0, 2.6, color = 'k', arrow_length_ratio = 0.05) # z-axis
+    ax.text( 1.5, 0, 0, '$x$',
+            color='k', fontweight=100, fontsize=15,
+            horizontalalignment='center', verticalalignment='center')
+    ax.text( 0, 1.5, 0, '$y$',
+            color='k', fontweight=100, fontsize=15,
+            horizontalalignment='center', verticalalignment='center')
+    ax.text( 0, 0, 1.5, '$|0\\rangle $',
+            color='red', fontweight=400, fontsize=15,
+            horizontalalignment='center', verticalalignment='center')
+    ax.text( 0, 0,-1.5, '$|1\\rangle $',
+            color='red', fontweight=400, fontsize=15,
+            horizontalalignment='center', verticalalignment='center')
+    ax.axis('off')
+    ax.set_box_aspect( [1, 1, 1] )
+
+def bloch_axes(fig: Figure = None) -> tuple:
+    """Add 3-D axes with a bloch sphere drawn to a figure.
+
+    Argument
+    ----------
+    fig : matplotlib.figure.Figure, optional
+        The figure to add the axes to. (default is None, create a new
+        figure which is not managed by pyplot)
+
+    Returns
+    ----------
+    fig : matplotlib.figure.Figure
+        The figure.
+    ax : mpl_toolkits.mplot3d.axes3d.Axes3D
+        The axes with a bloch sphere drawn.
+    """
+    if fig is None:
+        fig = Figure()
+    ax = fig.add_subplot(111, projection = '3d')
+    draw_sphere(ax)
+    return fig, ax
+
+def plot_trajectory(u: np.ndarray,
+                    *,
+                    ax = None,
+                    sepe_N: int = 0) -> tuple:
+    """Plot the trajectory of the qubit on a bloch sphere.
+
+    Argument
+    ----------
+    u : numpy.ndarray with shape (4, N)
+        The points to be plot, see `blochsolve`.
+
+    Keyword Arguments
+    ----------
+    ax : mpl_toolkits.mplot3d.axes3d.Axes3D, optional
+        The axes to plot on, the bloch sphere is drawn on it if it is empty.
+        (default is None, plot on `bloch_axes()`)
+    sepe_N : int, optional (default is 0, it doesn't draw any marker)
+        Plot a blue marker for every sepe_N points in the given positions.
+
+    Returns
+    ----------
+    fig : matplotlib.figure.Figure
+        The figure of the axes.
+    ax : mpl_toolkits.mplot3d.axes3d.Axes3D
+        The axes.
+    """
+    u = _check_u(u)
+    if ax is None:
+        fig, ax = bloch_axes()
+    else:
+        fig = ax.figure
+        if not ax.has_data():
+            draw_sphere(ax)
+    ax.plot(*u, linewidth=5)
+    ax.plot(*u[:, -1], 'ro')
+    if sepe_N: ax.plot(*u[:, ::sepe_N], 'b o')
+    return fig, ax
+
+def animate_trajectory(u: np.ndarray, t_interval: float,
+                       *,
+                       ax = None) -> tuple:
+    """Animate the time evolution of the qubit on a bloch sphere.
+
+    The animation stops when its object is garbage collected, keep a
+    reference to it while it is displayed or saved.
+
+    Arguments
+    ----------
+    u : numpy.ndarray with shape (4, N)
+        The points to be animate, see `blochsolve`.
+    t_interval : float
+        The time interval between each fram of the animation, in seconds.
+
+    Keyword Argument
+    ----------
+    ax : mpl_toolkits.mplot3d.axes3d.Axes3D, optional
+        The axes to animate on, the bloch sphere is drawn on it if it is empty.
+        (default is None, animate on `bloch_axes()`)
+
+    Returns
+    ----------
+    fig : matplotlib.figure.Figure
+        The figure of the axes.
+    ax : mpl_toolkits.mplot3d.axes3d.Axes3D
+        The axes.
+    animation : matplotlib.animation.FuncAnimation
+        The animation, e.g. save it by `animation.save('qubit.gif')`.
+    """
+    u = _check_u(u)
+    if ax is None:
+        fig, ax = bloch_axes()
+    else:
+        fig = ax.figure
+        if not ax.has_data():
+            draw_sphere(ax)
+    t_interval = t_interval * 1000 # s --> ms
+
+    def update_lines(num, datas, lines):
+        for data in datas:
+            # current state
+            lines[0].set_data(data[0:2, num-1:num])
+            lines[0].set_3d_properties(data[2, num-1:num])
+            # trajectory
+            lines[1].set_data(data[0:2, :num])
+            lines[1].set_3d_properties(data[2, :num])
+        return lines
+    linobjs = [
+        # plot current state (as a point on bloch sphere).
+        ax.plot(*u, 'ro')[0],
+        # plot trajectory
+        ax.plot(*u, linewidth=3)[0]
+    ]
+
+    sam_num = u.shape[1]
+    animation = matplotlib.animation.FuncAnimation(
+        fig, update_lines, sam_num, fargs=([u], linobjs),
+        interval=t_interval, blit=False, repeat=True, repeat_delay=1000)
+    return fig, ax, animation
+
+def phy_arg_samples(expe, phyarg_name: str,
+                    dt: float) -> Tuple[np.ndarray]:
+    """Sample a physical argument throught the entire experiment.
+
+    Arguments
+    ----------
+    expe : ExpScheme object
+        The experiment scheme.
+    phyarg_name : string
+        The name of the physical argument, one of (I, Q, d, z0, G1, G2).
+    dt : float
+        The time interval for sampling callable physical arguments,
+        constant ones are sampled at the start and the end of sections,
+        linear interpolation tables at their own samples.
+
+    Returns
+    ----------
+    samt : numpy.ndarray with shape (N,)
+        The sampling time.
+    magnitude : numpy.ndarray with shape (N,)
+        The physical argument at the sampling time.
+    """
+    magnitude = []
+    samt = []
+    t_sofar = 0
+    for act in expe.sequence:
+        goal = act.phy_args[phyarg_name]
+        if isinstance(goal, InterpolationTable) and goal.kind == 'linear':
+            # the table is exactly the lines joining its samples
+            samt = np.concatenate((samt, t_sofar + goal.t))
+            magnitude = np.concatenate((magnitude, goal.values))
+        elif isinstance(goal, InterpolationTable): # is cubic
+            samt_section = np.linspace(
+                t_sofar, act.s+t_sofar, int(act.s/dt))
+            samt = np.concatenate((samt, samt_section))
+            magnitude = np.concatenate((magnitude, goal(samt_section-t_sofar)))
+        elif callable(goal):
+            samt_section = np.linspace(
+                t_sofar, act.s+t_sofar, int(act.s/dt))
+            magnitude_section = [goal(t-t_sofar) for t in samt_section]
+            samt = np.concatenate((samt, samt_section))
+            magnitude = np.concatenate((magnitude, magnitude_section))
+        else: # is constant
+            samt_section = [t_sofar, act.s+t_sofar]
+            samt = np.concatenate((samt, samt_section))
+            magnitude =  np.concatenate((magnitude, [goal, goal]))
+        t_sofar += act.s
+    return np.asarray(samt, dtype=float), np.asarray(magnitude, dtype=float)
+
+def plot_phy_arg(expe, phyarg_name: str, dt: float,
+                 *,
+                 ax = None,
+                 mu_s_scale: bool = True) -> tuple:
+    """Plot a physical argument throught the entire experiment.
+
+    Arguments
+    ----------
+    expe : ExpScheme object
+        The experiment scheme.
+    phyarg_name : string
+        The name of the physical argument, one of (I, Q, d, z0, G1, G2).
+    dt : float
+        The time interval for sampling (for plotting).
+
+    Keyword Arguments
+    ----------
+    ax : matplotlib.axes.Axes, optional
+        The axes to plot on. (default is None, plot on a new figure which
+        is not managed by pyplot)
+    mu_s_scale : bool, optional
+        Plot time in micro second, default is True.
+
+    Returns
+    ----------
+    fig : matplotlib.figure.Figure
+        The figure of the axes.
+    ax : matplotlib.axes.Axes
+        The axes.
+    """
+    samt, magnitude = phy_arg_samples(expe, phyarg_name, dt)
+    if ax is None:
+        fig = Figure()
+        ax = fig.add_subplot(111)
+    else:
+        fig = ax.figure
+    if mu_s_scale:
+        ax.set_xlabel('$t/\\mu s$')
+        ax.plot(samt * 1e+6, magnitude)
+    else:
+        ax.set_xlabel('$t/s$')
+        ax.plot(samt, magnitude)
+    return fig, ax
@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+"""Rotating frame (interaction picture) for lab-frame microwave drives.
+
+A qubit with transition angular frequency wq driven by a microwave carrier wc
+precesses at multi-GHz rates in the lab frame, resolving that in the numerical
+integral requires a prohibitively small sampling time. By moving to the frame
+rotating at wc about the z-axis, the bloch equation only contains the slow
+envelope of the drive and the detune d = wq - wc:
+
+    u_lab(t) = Rz(wc*t) u_rot(t)
+
+For a linearly polarized drive with envelope (I, Q), the lab-frame drive
+splits into a co-rotating part, which is static (I, Q) in the rotating frame,
+and a counter-rotating part, which rotates at -2*wc in the rotating frame.
+Three treatments of the counter-rotating part are provided :
+
+  * 'rwa' -- rotating wave approximation, drop it.
+  * 'bloch-siegert' -- drop it, but keep its leading order effect, the
+    Bloch-Siegert shift (I^2 + Q^2) / (2*(d + 2*wc)) added to the detune.
+  * 'exact' -- keep it as a fast oscillating term, exact but requires the
+    sampling time to resolve 2*wc.
+
+The carrier is set by `ExpScheme(..., carrier=wc, counter_rotating='rwa')`,
+`blochsolve` then integrates in the rotating frame. Use `to_lab_frame` to
+transform the solution back to the lab frame on demand.
+
+function
+----------
+to_lab_frame
+to_rotating_frame
+"""
+
+import numpy as np
+from typing import Callable, Tuple
+__all__ = [
+    'to_lab_frame',
+    'to_rotating_frame'
+]
+
+COUNTER_ROTATING_OPTIONS = ('rwa', 'bloch-siegert', 'exact')
+
+def _rotate_z(u_sol: np.ndarray, angle: np.ndarray) -> np.ndarray:
+    """Rotate the (x, y) components of a solution by angle about z-axis."""
+    if type(u_sol) is not np.ndarray:
+        raise TypeError(
+            f'The input for u_sol is not numpy.ndarray') from None
+    if not u_sol.shape[0] == 4:
+        raise TypeError(
+            f'The shape of u_sol is {u_sol.shape}, it should be (4, N)') from None
+    cos, sin = np.cos(angle), np.sin(angle)
+    u_new = u_sol.astype(float, copy=True)
+    u_new[1] = cos * u_sol[1] - sin * u_sol[2]
+    u_new[2] = sin * u_sol[1] + cos * u_sol[2]
+    return u_new
+
+def to_lab_frame(u_sol: np.ndarray, carrier: float) -> np.ndarray:
+    """Transform a rotating frame solution to the lab frame.
+
+    Arguments
+    ----------
+    u_sol : numpy.ndarray with shape (4, N)
+        The solution in the frame rotating at `carrier`, as returned
+        by `blochsolve`.
+    carrier : float
+        The angular frequency of the rotating frame, in rad/s.
+
+    Returns
+    ----------
+    u_lab : numpy.ndarray with shape (4, N)
+        The solution in the lab frame, with the same sampling time.
+    """
+    return _rotate_z(u_sol, carrier * u_sol[0])
+
+def to_rotating_frame(u_sol: np.ndarray, carrier: float) -> np.ndarray:
+    """Transform a lab frame solution to the frame rotating at carrier.
+
+    Arguments
+    ----------
+    u_sol : numpy.ndarray with shape (4, N)
+        The solution in the lab frame.
+    carrier : float
+        The angular frequency of the rotating frame, in rad/s.
+
+    Returns
+    ----------
+    u_rot : numpy.ndarray with shape (4, N)
+        The solution in the rotating frame, with the same sampling time.
+    """
+    return _rotate_z(u_sol, -carrier * u_sol[0])
+
+def _value_at(arg: Callable[[float], float] or float, t: float) -> float:
+    """Evaluate a physical argument at time t."""
+    return arg(t) if callable(arg) else arg
+
+def _rotating_frame_args(args: tuple,
+                         carrier: float,
+                         counter_rotating: str,
+                         t0: float = 0) -> Tuple:
+    '''
+    Apply the counter-rotating treatment to the arguments of a section.
+
+    Arguments
+    ----------
+    args : tuple
+        = (I, Q, d, z0, G1, G2), the arguments of the section, where I, Q
+        are the drive envelope and d is the detune from the carrier.
+    carrier : float
+        The angular frequency of the rotating frame, in rad/s.
+    counter_rotating : str
+        One of 'rwa', 'bloch-siegert' or 'exact'.
+    t0 : float
+        The starting time of the section, the phase of the counter-rotating
+        term refers to the absolute time.
+
+    Returns
+    ----------
+    args : tuple
+        = (I, Q, d, z0, G1, G2), the arguments in the rotating frame.
+    '''
+    I, Q, d, z0, G1, G2 = args
+    if counter_rotating == 'rwa':
+        return args
+    if counter_rotating == 'bloch-siegert':
+        if not any(callable(arg) for arg in (I, Q, d)):
+            return I, Q, d + (I**2 + Q**2) / (2*(d + 2*carrier)), z0, G1, G2
+        def d_shifted(t):
+            I_t, Q_t, d_t = (_value_at(arg, t) for arg in (I, Q, d))
+            return d_t + (I_t**2 + Q_t**2) / (2*(d_t + 2*carrier))
+        return I, Q, d_shifted, z0, G1, G2
+    if counter_rotating == 'exact':
+        def I_exact(t):
+            I_t, Q_t = _value_at(I, t), _value_at(Q, t)
+            phase = 2 * carrier * (t0 + t)
+            return I_t - Q_t*np.sin(phase) - I_t*np.cos(phase)
+        def Q_exact(t):
+            I_t, Q_t = _value_at(I, t), _value_at(Q, t)
+            phase = 2 * carrier * (t0 + t)
+            return Q_t + Q_t*np.cos(phase) - I_t*np.sin(phase)
+        return I_exact, Q_exact, d, z0, G1, G2
+    raise ValueError(
+        f'The counter_rotating option {counter_rotating} is not one of '
+        + f'{COUNTER_ROTATING_OPTIONS}.') from None
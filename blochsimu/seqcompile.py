@@ -0,0 +1,318 @@
+# -*- coding: utf-8 -*-
+"""Compile an experiment scheme by reusing the propagators of repeated blocks.
+
+Pulse programs repeat sections and blocks of sections, e.g. randomized
+benchmarking draws long sequences from a small gate set, and echo trains
+repeat X90 - wait - Y180 - wait. Since the propagator of a section maps any
+initial position to the final one (see module `propagator`), each distinct
+section and each distinct block only needs to be computed once.
+
+`compile_scheme`, or `ExpScheme.compile`, canonicalizes the sections, such
+that sections with equal duration and equal physical arguments share one
+symbol. Then repeated contiguous pairs of symbols are replaced by new symbols
+pass by pass (a variant of the Re-Pair grammar compression), until no pair
+repeats. The result is a DAG, each symbol is a section or a pair of symbols,
+and the sequence is a short list of symbols.
+
+    compiled = expe.compile()
+    u_end = compiled.final_state()
+    print(compiled.stats['dedup_ratio'])
+
+The propagator of a section with constant physical arguments is exact, the
+one of a section with callable physical arguments is integrated numerically.
+Only the final position is solved, use `blochsolve` for the trajectory.
+
+Class
+----------
+CompiledScheme
+
+function
+----------
+section_key
+compile_scheme
+"""
+
+import hashlib
+import json
+import numbers
+import numpy as np
+from collections import Counter
+from scipy.integrate import odeint
+from .rotframe import _rotating_frame_args
+from .propagator import PHY_ARG_NAMES, bloch_generator, affine_propagator
+from .waveform import WAVEFORM_TYPES
+from typing import Dict, List, Tuple
+__all__ = [
+    'CompiledScheme',
+    'section_key',
+    'compile_scheme'
+]
+
+def _arg_key(arg) -> tuple:
+    """Return a hashable key of a physical argument, equal if equal."""
+    if isinstance(arg, numbers.Real):
+        return ('value', float(arg))
+    if type(arg) in WAVEFORM_TYPES.values():
+        digest = hashlib.sha256(type(arg).__name__.encode())
+        for name, value in sorted(arg.to_spec().items()):
+            if name in getattr(type(arg), 'METADATA', ()):
+                continue
+            digest.update(name.encode())
+            if isinstance(value, np.ndarray):
+                digest.update(np.ascontiguousarray(value, '<f8').tobytes())
+            else:
+                digest.update(json.dumps(value).encode())
+        return ('spec', digest.hexdigest())
+    # other callables are only equal to themselves
+    return ('id', id(arg))
+
+def section_key(section, t0: float = 0) -> tuple:
+    '''
+    Return the canonical key of a section.
+
+    Sections with equal keys have equal propagators. Numbers are compared
+    by value, wave forms of module `waveform` by their spec, and other
+    callables by identity.
+
+    Arguments
+    ----------
+    section : Section object
+        The section, which belongs to an experiment scheme.
+    t0 : float, optional
+        The starting time of the section, only part of the key when the
+        counter-rotating term is solved exactly, whose phase refers to the
+        absolute time. (default is 0)
+
+    Returns
+    ----------
+    key : tuple
+        The hashable key.
+    '''
+    expe = section.expe
+    frame = None
+    if expe.carrier is not None:
+        frame = (float(expe.carrier), expe.counter_rotating)
+        if expe.counter_rotating == 'exact':
+            frame += (float(t0),)
+    return ((float(section.s), frame)
+            + tuple(_arg_key(section.phy_args[name])
+                    for name in PHY_ARG_NAMES))
+
+def _numerical_propagator(args: tuple, s: float) -> np.ndarray:
+    """Integrate the 4x4 propagator of a section with callable args."""
+    def dPdt(P, t):
+        I, Q, d, z0, G1, G2 = (
+            arg(t) if callable(arg) else arg for arg in args)
+        P = P.reshape(3, 4)
+        x, y, z = P
+        return np.concatenate([
+            -G2*x - d*y + I*z,
+            d*x - G2*y - Q*z,
+            -I*x + Q*y - G1*z + G1*z0 * np.array([0., 0., 0., 1.])])
+    P0 = np.eye(4)[:3].ravel()
+    P = odeint(dPdt, P0, [0, s])[-1].reshape(3, 4)
+    return np.vstack([P, [0., 0., 0., 1.]])
+
+def _re_pair(sequence: List[int],
+             first_symbol: int) -> Tuple[List[int], Dict[int, tuple]]:
+    '''
+    Compress a sequence of symbols by replacing repeated pairs.
+
+    Unlike the original Re-Pair, which replaces one pair at a time, each
+    pass replaces all pairs that occur at least twice, from left to right,
+    so the sequence about halves in each pass. The passes stop when no pair
+    repeats.
+
+    Arguments
+    ----------
+    sequence : list[int]
+        The symbols.
+    first_symbol : int
+        The first new symbol, larger than all symbols in the sequence.
+
+    Returns
+    ----------
+    sequence : list[int]
+        The compressed sequence.
+    rules : dict
+        rules[symbol] = (a, b), the new symbol stands for a then b.
+    '''
+    rules = {}
+    symbols = {}
+    while len(sequence) > 1:
+        counts = Counter(zip(sequence[:-1], sequence[1:]))
+        repeated = {pair for pair, count in counts.items() if count > 1}
+        if not repeated:
+            break
+        replaced = []
+        i = 0
+        n = len(sequence)
+        while i < n:
+            pair = tuple(sequence[i:i+2])
+            if pair in repeated:
+                if pair not in symbols:
+                    symbols[pair] = first_symbol + len(rules)
+                    rules[symbols[pair]] = pair
+                replaced.append(symbols[pair])
+                i += 2
+            else:
+                replaced.append(sequence[i])
+                i += 1
+        if len(replaced) == n:
+            break
+        sequence = replaced
+    return sequence, rules
+
+class CompiledScheme:
+    """An experiment scheme compiled into a DAG of unique blocks.
+
+    Instance variables
+    ----------
+    expe : ExpScheme
+        The compiled experiment scheme.
+    leaves : list
+        leaves[k] = (args, s), the arguments in the solved frame and the
+        duration of the k-th unique section, whose symbol is k.
+    rules : dict
+        rules[symbol] = (a, b), the block of symbol a then symbol b.
+    sequence : list[int]
+        The symbols that make up the experiment scheme in order.
+    stats : dict
+        'sections' and 'unique_sections' count the sections, 'rules' and
+        'top_level' the blocks and the length of sequence. 'dedup_ratio' is
+        sections / unique_sections, the saving of computed propagators,
+        'matmul_ratio' the saving of matrix multiplications.
+
+    Public methods
+    ----------
+    propagator -- the 4x4 affine propagator of the whole experiment.
+    final_state -- the final position of the experiment.
+    """
+
+    def __init__(self, expe) -> None:
+        """Canonicalize the sections and compress the sequence.
+
+        Argument
+        ----------
+        expe : ExpScheme object
+            The experiment scheme.
+        """
+        self.expe = expe
+        self._compile()
+
+    def _section_keys(self) -> List[tuple]:
+        """Return the key of each section of the experiment scheme."""
+        keys = []
+        t_sofar = 0
+        for section in self.expe.sequence:
+            keys.append(section_key(section, t_sofar))
+            t_sofar += section.s
+        return keys
+
+    def _compile(self) -> None:
+        """Canonicalize the sections and compress the sequence."""
+        expe = self.expe
+        self._keys = self._section_keys()
+        self.leaves = []
+        symbols = {}
+        sequence = []
+        t_sofar = 0
+        for section, key in zip(expe.sequence, self._keys):
+            if key not in symbols:
+                args = tuple(section.phy_args[name] for name in PHY_ARG_NAMES)
+                if expe.carrier is not None:
+                    args = _rotating_frame_args(
+                        args, expe.carrier, expe.counter_rotating, t_sofar)
+                symbols[key] = len(self.leaves)
+                self.leaves.append((args, section.s))
+            sequence.append(symbols[key])
+            t_sofar += section.s
+        self.sequence, self.rules = _re_pair(sequence, len(self.leaves))
+        n = len(expe.sequence)
+        k = len(self.leaves)
+        matmuls = len(self.rules) + max(len(self.sequence) - 1, 0)
+        self.stats = {
+            'sections': n,
+            'unique_sections': k,
+            'rules': len(self.rules),
+            'top_level': len(self.sequence),
+            'dedup_ratio': n / k if k else 1.,
+            'matmul_ratio': (n - 1) / matmuls if matmuls else 1.,
+        }
+        self._propagators = None
+
+    def _leaf_propagators(self) -> List[np.ndarray]:
+        """Compute the propagator of each unique section."""
+        propagators = [None] * len(self.leaves)
+        constant = [k for k, (args, s) in enumerate(self.leaves)
+                    if not any(callable(arg) for arg in args)]
+        if constant:
+            args = np.array([self.leaves[k][0] for k in constant]).T
+            s = np.array([self.leaves[k][1] for k in constant])
+            for k, P in zip(constant,
+                            affine_propagator(bloch_generator(*args), s)):
+                propagators[k] = P
+        for k, (args, s) in enumerate(self.leaves):
+            if propagators[k] is None:
+                propagators[k] = _numerical_propagator(args, s)
+        return propagators
+
+    def propagator(self) -> np.ndarray:
+        '''
+        Return the affine propagator of the whole experiment.
+
+        Each unique section and each block is computed once, the result is
+        kept for later calls. The sections are compared by `section_key`
+        at each call, if the experiment scheme was changed since, e.g. the
+        samples of a `PiecewiseConstant` by `grape`, it is compiled again.
+
+        Returns
+        ----------
+        propagator : numpy.ndarray with shape (4, 4)
+            Maps (u0, 1) to (u_end, 1).
+        '''
+        if self._section_keys() != self._keys:
+            self._compile()
+        if self._propagators is None:
+            propagators = dict(enumerate(self._leaf_propagators()))
+            # rules only refer to smaller symbols
+            for symbol in sorted(self.rules):
+                a, b = self.rules[symbol]
+                propagators[symbol] = propagators[b] @ propagators[a]
+            self._propagators = propagators
+        total = np.eye(4)
+        for symbol in self.sequence:
+            total = self._propagators[symbol] @ total
+        return total
+
+    def final_state(self) -> np.ndarray:
+        '''
+        Return the final position of the experiment.
+
+        Returns
+        ----------
+        u_end : numpy.ndarray with shape (3,)
+            The final position (x, y, z).
+        '''
+        return (self.propagator() @ np.append(self.expe.u0, 1.))[:3]
+
+    def __repr__(self):
+        return (f"A compiled scheme of {self.stats['sections']} sections "
+                + f"into {self.stats['unique_sections']} unique sections "
+                + f"and {self.stats['rules']} blocks")
+
+def compile_scheme(expe) -> CompiledScheme:
+    '''
+    Compile an experiment scheme into a DAG of unique blocks.
+
+    Argument
+    ----------
+    expe : ExpScheme object
+        The experiment scheme.
+
+    Returns
+    ----------
+    compiled : CompiledScheme
+        The compiled scheme, see `CompiledScheme`.
+    '''
+    return CompiledScheme(expe)
@@ -0,0 +1,331 @@
+# -*- coding: utf-8 -*-
+"""Serialize experiment schemes to a declarative JSON format.
+
+An experiment scheme is described by data only, so it can be shipped to other
+processes, stored on disk, or used as the key of a result cache. The physical
+arguments are either a number or a wave form described by its spec, that is
+its type and parameters (see `waveform.WAVEFORM_TYPES`), for example :
+
+    {
+      "format": "blochsimu.expscheme", "version": 1,
+      "u0": [0.0, 0.0, 1.0],
+      "defaults": {"z0": 1.0, "I": 0.0, "Q": 0.0, "d": 0.0,
+                   "G1": 11764.7, "G2": 8333.3},
+      "carrier": null, "counter_rotating": "rwa",
+      "sequence": [
+        {"s": 1.7e-05, "phy_args": {"I": {"type": "gaussian_padded_pulse",
+          "t_on": 1e-05, "sigma": 1e-06, "height": 100000.0,
+          "t_pad_ratio": 3.5}}},
+        {"s": 4e-05, "phy_args": {}}
+      ]
+    }
+
+Each section only keeps the physical arguments that overwrite the default
+ones. Arrays, e.g. the samples of `PiecewiseConstant`, are written inline as
+lists, or with `blob=True` as references {"$array": "a0"} into a separate
+binary `.npz` blob.
+
+Arbitrary callables, like lambdas and closures, can not be serialized, use
+the wave forms in module `waveform` instead.
+
+The content hash only depends on what is solved, that is the initial
+position, the frame and the physical arguments and duration of each section,
+regardless of how they are split into defaults and overwrites, and of the
+metadata of wave forms, like the error estimate of interpolation tables.
+
+function
+----------
+scheme_to_dict
+scheme_from_dict
+dumps
+loads
+save
+load
+content_hash
+"""
+
+import io
+import json
+import hashlib
+import numbers
+import numpy as np
+from .expscheme import Section, ExpScheme
+from .waveform import WAVEFORM_TYPES
+from .propagator import PHY_ARG_NAMES
+from typing import Dict, Tuple
+__all__ = [
+    'scheme_to_dict',
+    'scheme_from_dict',
+    'dumps',
+    'loads',
+    'save',
+    'load',
+    'content_hash'
+]
+
+FORMAT = 'blochsimu.expscheme'
+VERSION = 1
+
+def _arg_to_data(name: str, arg, arrays: Dict[str, np.ndarray] or None,
+                 metadata: bool = True):
+    """Describe a physical argument by data, store arrays to arrays, without
+    the spec entries in METADATA of the wave form type if not metadata."""
+    if isinstance(arg, numbers.Real):
+        return float(arg)
+    for type_name, cls in WAVEFORM_TYPES.items():
+        if type(arg) is cls:
+            break
+    else:
+        raise TypeError(
+            f'The physical argument {name}, {arg}, can not be serialized, '
+            + 'describe it by a wave form of module `waveform`.') from None
+    data = {'type': type_name}
+    for key, value in arg.to_spec().items():
+        if not metadata and key in getattr(cls, 'METADATA', ()):
+            continue
+        if isinstance(value, numbers.Real):
+            value = float(value)
+        elif isinstance(value, np.ndarray):
+            if arrays is None:
+                value = value.tolist()
+            else:
+                key_array = f'a{len(arrays)}'
+                arrays[key_array] = value
+                value = {'$array': key_array}
+        data[key] = value
+    return data
+
+def _arg_from_data(data, arrays: Dict[str, np.ndarray] or None):
+    """Create a physical argument from the output of `_arg_to_data`."""
+    if isinstance(data, numbers.Real):
+        return data
+    spec = {}
+    for key, value in data.items():
+        if key == 'type':
+            continue
+        if isinstance(value, dict) and '$array' in value:
+            if arrays is None:
+                raise ValueError(
+                    'The scheme refers to an array blob, which is not '
+                    + 'provided.') from None
+            value = np.asarray(arrays[value['$array']])
+        spec[key] = value
+    if data['type'] not in WAVEFORM_TYPES:
+        raise ValueError(
+            f'The wave form type {data["type"]} is unknown.') from None
+    return WAVEFORM_TYPES[data['type']].from_spec(spec)
+
+def _is_default(arg, default) -> bool:
+    """Check if a physical argument of a section is the default one."""
+    if callable(arg) or callable(default):
+        return arg is default
+    return arg == default
+
+def scheme_to_dict(expe: ExpScheme,
+                   arrays: Dict[str, np.ndarray] = None) -> dict:
+    '''
+    Describe an experiment scheme by a JSON-compatible dictionary.
+
+    Arguments
+    ----------
+    expe : ExpScheme object
+        The experiment scheme.
+    arrays : dict, optional
+        If provided, arrays are stored into it and referred by key,
+        otherwise they are written inline as lists.
+
+    Returns
+    ----------
+    data : dict
+        The description of the experiment scheme.
+    '''
+    defaults = expe.default_phy_args
+    sequence = []
+    for section in expe.sequence:
+        phy_args = {
+            name: _arg_to_data(name, section.phy_args[name], arrays)
+            for name in PHY_ARG_NAMES
+            if not _is_default(section.phy_args[name], defaults[name])}
+        sequence.append({'s': float(section.s), 'phy_args': phy_args})
+    return {
+        'format': FORMAT,
+        'version': VERSION,
+        'u0': [float(u) for u in expe.u0],
+        'defaults': {name: _arg_to_data(name, defaults[name], arrays)
+                     for name in PHY_ARG_NAMES},
+        'carrier': None if expe.carrier is None else float(expe.carrier),
+        'counter_rotating': expe.counter_rotating,
+        'sequence': sequence,
+    }
+
+def scheme_from_dict(data: dict,
+                     arrays: Dict[str, np.ndarray] = None) -> ExpScheme:
+    '''
+    Create an experiment scheme from the output of `scheme_to_dict`.
+
+    Arguments
+    ----------
+    data : dict
+        The description of the experiment scheme.
+    arrays : dict, optional
+        The arrays referred by the description.
+
+    Returns
+    ----------
+    expe : ExpScheme object
+        The experiment scheme.
+    '''
+    if data.get('format') != FORMAT or data.get('version') != VERSION:
+        raise ValueError(
+            f'The data is not a {FORMAT} of version {VERSION}.') from None
+    expe = ExpScheme(
+        u0=tuple(data['u0']),
+        **{name: _arg_from_data(value, arrays)
+           for name, value in data['defaults'].items()},
+        carrier=data['carrier'],
+        counter_rotating=data['counter_rotating'])
+    expe.sequence = tuple(
+        Section(section['s'],
+                **{name: _arg_from_data(value, arrays)
+                   for name, value in section['phy_args'].items()})
+        for section in data['sequence'])
+    return expe
+
+def dumps(expe: ExpScheme,
+          *,
+          blob: bool = False) -> str or Tuple[str, bytes]:
+    '''
+    Serialize an experiment scheme to a JSON string.
+
+    Arguments
+    ----------
+    expe : ExpScheme object
+        The experiment scheme.
+
+    Keyword Argument
+    ----------
+    blob : bool, optional
+        If true, arrays are written to a separate `.npz` binary blob.
+        (default is False, arrays are written inline)
+
+    Returns
+    ----------
+    text : str
+        The JSON string.
+    blob : bytes
+        The `.npz` blob of arrays, only returned if blob is true.
+    '''
+    if not blob:
+        return json.dumps(scheme_to_dict(expe))
+    arrays = {}
+    text = json.dumps(scheme_to_dict(expe, arrays))
+    buffer = io.BytesIO()
+    np.savez_compressed(buffer, **arrays)
+    return text, buffer.getvalue()
+
+def loads(text: str, blob: bytes = None) -> ExpScheme:
+    '''
+    Create an experiment scheme from the output of `dumps`.
+
+    Arguments
+    ----------
+    text : str
+        The JSON string.
+    blob : bytes, optional
+        The `.npz` blob of arrays, if the JSON string refers to it.
+
+    Returns
+    ----------
+    expe : ExpScheme object
+        The experiment scheme.
+    '''
+    arrays = None
+    if blob is not None:
+        with np.load(io.BytesIO(blob)) as npz:
+            arrays = dict(npz)
+    return scheme_from_dict(json.loads(text), arrays)
+
+def save(expe: ExpScheme, path: str, *, blob: bool = False) -> None:
+    '''
+    Save an experiment scheme to a JSON file.
+
+    Arguments
+    ----------
+    expe : ExpScheme object
+        The experiment scheme.
+    path : str
+        The path of the JSON file, the blob is saved to path + '.npz'.
+
+    Keyword Argument
+    ----------
+    blob : bool, optional
+        If true, arrays are saved to a separate `.npz` blob. (default is
+        False, arrays are written inline)
+    '''
+    if blob:
+        text, blob_bytes = dumps(expe, blob=True)
+        with open(path + '.npz', 'wb') as f:
+            f.write(blob_bytes)
+    else:
+        text = dumps(expe)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(text)
+
+def load(path: str) -> ExpScheme:
+    '''
+    Load an experiment scheme saved by `save`.
+
+    Arguments
+    ----------
+    path : str
+        The path of the JSON file.
+
+    Returns
+    ----------
+    expe : ExpScheme object
+        The experiment scheme.
+    '''
+    with open(path, 'r', encoding='utf-8') as f:
+        text = f.read()
+    blob = None
+    if '"$array"' in text:
+        with open(path + '.npz', 'rb') as f:
+            blob = f.read()
+    return loads(text, blob)
+
+def content_hash(expe: ExpScheme) -> str:
+    '''
+    Return a stable hash of what an experiment scheme solves.
+
+    Arguments
+    ----------
+    expe : ExpScheme object
+        The experiment scheme.
+
+    Returns
+    ----------
+    digest : str
+        The hexadecimal SHA-256 digest.
+    '''
+    arrays = {}
+    content = {
+        'format': FORMAT,
+        'version': VERSION,
+        'u0': [float(u) for u in expe.u0],
+        'carrier': None if expe.carrier is None else float(expe.carrier),
+        'counter_rotating': (None if expe.carrier is None
+                             else expe.counter_rotating),
+        'sequence': [
+            {'s': float(section.s),
+             'phy_args': {name: _arg_to_data(name, section.phy_args[name],
+                                             arrays, metadata=False)
+                          for name in PHY_ARG_NAMES}}
+            for section in expe.sequence],
+    }
+    digest = hashlib.sha256(
+        json.dumps(content, sort_keys=True, separators=(',', ':')).encode())
+    for key in sorted(arrays, key=lambda key: int(key[1:])):
+        array = np.ascontiguousarray(arrays[key], dtype='<f8')
+        digest.update(repr(array.shape).encode())
+        digest.update(array.tobytes())
+    return digest.hexdigest()
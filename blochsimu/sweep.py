@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+"""Sweep an experiment over a list of values, e.g. the waiting time tau.
+
+An experiment like Ramsey or echo is repeated for many values of a parameter,
+and often only the final position of each experiment is of interest. The
+function `sweep` accepts a callable that builds the experiment scheme for a
+given value, then returns the final positions of all experiments.
+
+Sections with constant physical arguments have exact propagators (see module
+`propagator`). Experiment schemes made only of such sections are stacked into
+arrays, padded by sections of zero duration, and solved in a batch by a single
+vectorized call, without any numerical integral. Other experiment schemes are
+solved by `blochsolve`.
+
+For 2-D maps, e.g. a Rabi chevron over detune and pulse duration, the
+function `map_sweep` solves the Cartesian product of two lists of values in
+chunks, which caps the memory and can run the chunks in parallel threads.
+
+function
+----------
+final_states
+sweep
+map_sweep
+"""
+
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from .expscheme import ExpScheme
+from .blochnumint import blochsolve, SOLVER_SETTINGS
+from .serialize import content_hash
+from .cache import ResultCache
+from .rotframe import _rotating_frame_args
+from .propagator import PHY_ARG_NAMES, bloch_generator, affine_propagator
+from typing import Callable, Iterable, List, Tuple
+__all__ = [
+    'final_states',
+    'sweep',
+    'map_sweep'
+]
+
+def _is_constant(expe: ExpScheme) -> bool:
+    """Check if all physical arguments of all sections are constant."""
+    if expe.carrier is not None and expe.counter_rotating == 'exact':
+        return False
+    return all(not callable(section.phy_args[name])
+               for section in expe.sequence for name in PHY_ARG_NAMES)
+
+def _stack_schemes(expes: List[ExpScheme]) -> Tuple[np.ndarray]:
+    '''
+    Stack experiment schemes with constant physical arguments into arrays.
+
+    Arguments
+    ----------
+    expes : list[ExpScheme]
+        The experiment schemes, all physical arguments must be constant.
+
+    Returns
+    ----------
+    args : numpy.ndarray with shape (6, n, m)
+        = (I, Q, d, z0, G1, G2) of the m-th section in n-th scheme, schemes
+        with less sections are padded by sections of zero duration.
+    s : numpy.ndarray with shape (n, m)
+        The duration of each section.
+    u0 : numpy.ndarray with shape (n, 3)
+        The initial position of each scheme.
+    '''
+    m = max((len(expe.sequence) for expe in expes), default=0)
+    args = np.zeros((6, len(expes), m))
+    s = np.zeros((len(expes), m))
+    u0 = np.zeros((len(expes), 3))
+    for i, expe in enumerate(expes):
+        if not _is_constant(expe):
+            raise ValueError(
+                'The experiment scheme has physical arguments that are not '
+                + 'constant.') from None
+        u0[i] = expe.u0
+        for j, section in enumerate(expe.sequence):
+            section_args = tuple(
+                section.phy_args[name] for name in PHY_ARG_NAMES)
+            if expe.carrier is not None:
+                section_args = _rotating_frame_args(
+                    section_args, expe.carrier, expe.counter_rotating)
+            args[:, i, j] = section_args
+            s[i, j] = section.s
+    return args, s, u0
+
+def _propagate_stack(args: np.ndarray, s: np.ndarray,
+                     u0: np.ndarray) -> np.ndarray:
+    """Return the final positions with shape (n, 3) of stacked schemes.
+
+    Repeated sections, e.g. the same pulse in every scheme, share one
+    propagator, only the unique (args, s) are exponentiated."""
+    rows = np.concatenate([args.reshape(6, -1), s.reshape(1, -1)]).T
+    unique_rows, inverse = np.unique(rows, axis=0, return_inverse=True)
+    propagators = affine_propagator(
+        bloch_generator(*unique_rows[:, :6].T), unique_rows[:, 6])
+    propagators = propagators[inverse.ravel()].reshape(s.shape + (4, 4))
+    u = np.concatenate([u0, np.ones((len(u0), 1))], axis=1)
+    for j in range(s.shape[1]):
+        u = np.einsum('nij,nj->ni', propagators[:, j], u)
+    return u[:, :3]
+
+def final_states(expes: Iterable[ExpScheme]) -> np.ndarray:
+    '''
+    Exactly solve the final positions of experiment schemes in a batch.
+
+    Arguments
+    ----------
+    expes : iterable of ExpScheme
+        The experiment schemes, all physical arguments of all sections must
+        be constant.
+
+    Returns
+    ----------
+    u_end : numpy.ndarray with shape (n, 3)
+        u_end[i] is the final position (x, y, z) of the i-th scheme.
+    '''
+    return _propagate_stack(*_stack_schemes(list(expes)))
+
+def _solve_ends(expes: List[ExpScheme], dt: float,
+                workers: int = None, cache: ResultCache = None) -> np.ndarray:
+    """Return the final positions with shape (n, 3), see `sweep`."""
+    if cache is not None:
+        key = cache.key(kind='sweep', dt=float(dt), solver=SOLVER_SETTINGS,
+                        schemes=[content_hash(expe) for expe in expes])
+        arrays = cache.get(key)
+        if arrays is not None:
+            return arrays['u_end']
+    u_end = np.zeros((len(expes), 3))
+    constant = np.array([_is_constant(expe) for expe in expes], dtype=bool)
+    if constant.any():
+        u_end[constant] = final_states(
+            expe for expe, is_constant in zip(expes, constant) if is_constant)
+    integrate = [expe for expe, is_constant in zip(expes, constant)
+                 if not is_constant]
+    solve_end = lambda expe: blochsolve(expe, dt)[0][1:4, -1]
+    if workers is None:
+        results = map(solve_end, integrate)
+    else:
+        with ThreadPoolExecutor(workers) as executor:
+            results = list(executor.map(solve_end, integrate))
+    for i, u in zip(np.nonzero(~constant)[0], results):
+        u_end[i] = u
+    if cache is not None:
+        cache.put(key, {'u_end': u_end})
+    return u_end
+
+def sweep(scheme_of: Callable[[float], ExpScheme],
+          values: Iterable,
+          dt: float,
+          *,
+          workers: int = None,
+          cache: ResultCache = None) -> np.ndarray:
+    '''
+    Solve the final positions of an experiment swept over values.
+
+    Arguments
+    ----------
+    scheme_of : callable(value)
+        Return the experiment scheme for a value.
+    values : iterable
+        The values to be swept.
+    dt : float
+        The time interval for sampling in numerical integration, only used
+        by experiment schemes with non-constant physical arguments.
+
+    Keyword Arguments
+    ----------
+    workers : int, optional
+        The number of threads to solve experiment schemes that need
+        numerical integration. (default is None, solve in this thread)
+    cache : ResultCache, optional
+        Load the final positions from the cache if the same experiment
+        schemes were swept with the same dt, otherwise store them into it.
+        (default is None)
+
+    Returns
+    ----------
+    u_end : numpy.ndarray with shape (n, 3)
+        u_end[i] is the final position (x, y, z) for the i-th value.
+    '''
+    expes = [scheme_of(value) for value in values]
+    return _solve_ends(expes, dt, workers, cache)
+
+def map_sweep(scheme_of: Callable[[float, float], ExpScheme],
+              values0: Iterable,
+              values1: Iterable,
+              dt: float,
+              *,
+              chunk_size: int = 4096,
+              workers: int = None,
+              cache: ResultCache = None) -> np.ndarray:
+    '''
+    Solve the final positions of an experiment swept over a 2-D map.
+
+    For example a Rabi chevron sweeps the detune and the pulse duration.
+    The Cartesian product of the values is solved in chunks, the
+    experiment schemes of a chunk are built and solved in a batch, which
+    caps the memory to a chunk.
+
+    Arguments
+    ----------
+    scheme_of : callable(value0, value1)
+        Return the experiment scheme for a pair of values.
+    values0 : iterable
+        The values of the first axis, e.g. the detunes.
+    values1 : iterable
+        The values of the second axis, e.g. the pulse durations.
+    dt : float
+        The time interval for sampling in numerical integration, only used
+        by experiment schemes with non-constant physical arguments.
+
+    Keyword Arguments
+    ----------
+    chunk_size : int, optional
+        The number of experiment schemes in each chunk. (default is 4096)
+    workers : int, optional
+        The number of threads to solve the chunks in parallel. (default is
+        None, solve in this thread)
+    cache : ResultCache, optional
+        Load the final positions of each chunk from the cache, otherwise
+        store them into it. (default is None)
+
+    Returns
+    ----------
+    u_end : numpy.ndarray with shape (n0, n1, 3)
+        u_end[i, j] is the final position (x, y, z) for the pair of i-th
+        value in values0 and j-th value in values1.
+    '''
+    values0, values1 = list(values0), list(values1)
+    n0, n1 = len(values0), len(values1)
+    u_end = np.zeros((n0 * n1, 3))
+
+    def solve_chunk(start):
+        stop = min(start + chunk_size, n0 * n1)
+        expes = [scheme_of(values0[index // n1], values1[index % n1])
+                 for index in range(start, stop)]
+        u_end[start:stop] = _solve_ends(expes, dt, cache=cache)
+
+    starts = range(0, n0 * n1, chunk_size)
+    if workers is None:
+        for start in starts:
+            solve_chunk(start)
+    else:
+        with ThreadPoolExecutor(workers) as executor:
+            list(executor.map(solve_chunk, starts))
+    return u_end.reshape(n0, n1, 3)
@@ -9,17 +9,112 @@ at points of finite discontinuity, known as 'the Gibbs phenomenon.'
 The most common approach is the Gaussian padding or Lorentz padding, which use
 Gaussian function and Lorentzian function.
 
+Arbitrary waveform generators output a sampled wave that holds each sample
+for a fixed time, which is described by `PiecewiseConstant`. Its samples are
+the parameters optimized by `grape`.
+
+Wave forms are callable objects rather than closures, so they can be pickled
+and described by their parameters, see module `serialize`.
+
+Any callable wave form can be tabulated by `tabulate` into an
+`InterpolationTable`, which is sampled on an adaptive grid, refined where the
+wave form curves until the interpolation error is within a tolerance. A table
+is fast to evaluate at a single time, which is how the integrator evaluates
+the physical arguments, see `ExpScheme.precompile`.
+
+Class
+----------
+GaussianPaddedPulse
+PiecewiseConstant
+InterpolationTable
+
 function
 ----------
 gaussian_padded_pulse
+tabulate
 """
 
+import bisect
 import numpy as np
+from scipy.interpolate import CubicSpline
 from matplotlib import pyplot as plt
 __all__ = [
-    'gaussian_padded_pulse'
+    'GaussianPaddedPulse',
+    'PiecewiseConstant',
+    'InterpolationTable',
+    'gaussian_padded_pulse',
+    'tabulate'
 ]
 
+INTERPOLATION_KINDS = ('linear', 'cubic')
+
+def _gaussian(x, height, canter, sigma):
+    """The 1D gaussian function with x be the variable."""
+    return height * np.exp( -1/2 * (x-canter)**2 / sigma**2 )
+
+class GaussianPaddedPulse:
+    """A pulse wave with gaussian padding, made by `gaussian_padded_pulse`.
+
+    Instance variables
+    ----------
+    t_on : float
+        The duration that the pulse wave is at maximan.
+    sigma : float
+        The stander deviation of the gaussian function.
+    height : float
+        The height of the pulse wave.
+    t_pad_ratio : float
+        The ratio between the time for padding and sigma.
+    total_time : float
+        The total time of pulse wave, include padding.
+    """
+
+    def __init__(self, t_on: float, sigma: float, height: float,
+                 t_pad_ratio: float = 3.5) -> None:
+        self.t_on = t_on
+        self.sigma = sigma
+        self.height = height
+        self.t_pad_ratio = t_pad_ratio
+        self.t_pad = t_pad_ratio * sigma
+        self.total_time = t_on + 2*self.t_pad
+
+    def __call__(self, t):
+        """Return the value at t, t can be an 1d numpy.array or float."""
+        height, sigma = self.height, self.sigma
+        t_pad, t_on, total_time = self.t_pad, self.t_on, self.total_time
+        if isinstance(t, np.ndarray):
+            result = np.zeros_like(t)
+            result[(0 <= t) & (t <= t_pad)] =\
+                _gaussian(t[(0 <= t) & (t <= t_pad)], height, t_pad, sigma)
+            result[(t_pad < t) & (t < t_pad+t_on)] = height
+            result[(t_pad+t_on <= t) & (t <= total_time)] =\
+                _gaussian(t[(t_pad+t_on <= t) & (t <= total_time)], 
+                          height, t_pad+t_on, sigma)
+            return result
+        else: # is a constant
+            if 0 <= t and t <= t_pad:
+                return _gaussian(t, height, t_pad, sigma)
+            elif t_pad < t and t < t_pad+t_on:
+                return height
+            elif t_pad+t_on <= t and t <= total_time:
+                return _gaussian(t, height, t_pad + t_on, sigma)
+            else: # assume what's outside is zero
+                return 0
+
+    def to_spec(self) -> dict:
+        """Return the parameters that describe this wave form."""
+        return {'t_on': self.t_on, 'sigma': self.sigma,
+                'height': self.height, 't_pad_ratio': self.t_pad_ratio}
+
+    @classmethod
+    def from_spec(cls, spec: dict) -> 'GaussianPaddedPulse':
+        """Create the wave form from the output of `to_spec`."""
+        return cls(**spec)
+
+    def __repr__(self):
+        return (f"A gaussian padded pulse with height {self.height:.3g} "
+                + f"in {self.total_time*1e+6:.2f} us")
+
 def gaussian_padded_pulse(*,
                           t_on: float, 
                           sigma: float,
@@ -44,35 +139,13 @@ def gaussian_padded_pulse(*,
     
     Returns
     ----------
-    waveform : callable(t)
+    waveform : GaussianPaddedPulse, a callable(t)
         The padded pulse wave, t can be an 1d numpy.array or float.
     total_time : float
         The total time of pulse wave, include padding.
     """
-    def gaussian(x, height, canter, sigma):
-        """The 1D gaussian function with x be the variable."""
-        return height * np.exp( -1/2 * (x-canter)**2 / sigma**2 )
-    t_pad = t_pad_ratio * sigma
-    total_time = t_on + 2*t_pad
-    def waveform(t):
-        if isinstance(t, np.ndarray):
-            result = np.zeros_like(t)
-            result[(0 <= t) & (t <= t_pad)] =\
-                gaussian(t[(0 <= t) & (t <= t_pad)], height, t_pad, sigma)
-            result[(t_pad < t) & (t < t_pad+t_on)] = height
-            result[(t_pad+t_on <= t) & (t <= total_time)] =\
-                gaussian(t[(t_pad+t_on <= t) & (t <= total_time)], 
-                         height, t_pad+t_on, sigma)
-            return result
-        else: # is a constant
-            if 0 <= t and t <= t_pad:
-                return gaussian(t, height, t_pad, sigma)
-            elif t_pad < t and t < t_pad+t_on:
-                return height
-            elif t_pad+t_on <= t and t <= total_time:
-                return gaussian(t, height, t_pad + t_on, sigma)
-            else: # assume what's outside is zero
-                return 0
+    waveform = GaussianPaddedPulse(t_on, sigma, height, t_pad_ratio)
+    total_time = waveform.total_time
     if peak:
         samt = np.linspace(0, total_time, 200)
         plt.plot(samt * 1e+6, waveform(samt))
@@ -80,3 +153,248 @@ def gaussian_padded_pulse(*,
         plt.title('A peak of gaussian padded pulse')
         plt.show(block=True)
     return waveform, total_time
+
+
+class PiecewiseConstant:
+    """A wave form that holds each sample for an equal slice of time.
+
+    Instance variables
+    ----------
+    samples : numpy.ndarray with shape (n,)
+        The value of each slice.
+    s : float
+        The total duration of the wave form, each slice lasts s/n.
+    """
+
+    def __init__(self, samples, s: float) -> None:
+        """Set the samples and the total duration.
+
+        Arguments
+        ----------
+        samples : array_like with shape (n,)
+            The value of each slice.
+        s : float
+            The total duration of the wave form.
+        """
+        samples = np.array(samples, dtype=float)
+        if samples.ndim != 1 or len(samples) == 0:
+            raise ValueError(
+                'The samples should be a non-empty 1d array.') from None
+        self.samples = samples
+        self.s = s
+
+    @property
+    def t_slice(self) -> float:
+        """The duration of each slice."""
+        return self.s / len(self.samples)
+
+    def __call__(self, t):
+        """Return the value at t, what's outside [0, s] is zero."""
+        last = len(self.samples) - 1
+        if isinstance(t, np.ndarray):
+            index = np.clip((t / self.t_slice).astype(int), 0, last)
+            return np.where((0 <= t) & (t <= self.s), self.samples[index], 0.)
+        else: # is a constant
+            if 0 <= t and t <= self.s:
+                return self.samples[min(int(t / self.t_slice), last)]
+            else: # assume what's outside is zero
+                return 0
+
+    def to_spec(self) -> dict:
+        """Return the parameters that describe this wave form."""
+        return {'samples': self.samples, 's': self.s}
+
+    @classmethod
+    def from_spec(cls, spec: dict) -> 'PiecewiseConstant':
+        """Create the wave form from the output of `to_spec`."""
+        return cls(**spec)
+
+    def __repr__(self):
+        return (f"A piecewise-constant wave with {len(self.samples)} slices"
+                + f" in {self.s*1e+6:.2f} us")
+
+class InterpolationTable:
+    """A wave form interpolated from samples on a grid, see `tabulate`.
+
+    The linear table joins the samples by straight lines, the cubic table
+    by the not-a-knot cubic spline, whose second derivative is continuous,
+    so the integrator keeps large steps across the samples. Outside of the
+    grid, the value of the nearest end is held.
+
+    Instance variables
+    ----------
+    t : numpy.ndarray with shape (n,)
+        The increasing sampling time, from 0 to the duration.
+    values : numpy.ndarray with shape (n,)
+        The value at each sampling time.
+    kind : str
+        The interpolation, 'linear' or 'cubic'.
+    error : float or None
+        The estimated maximal absolute error of the interpolation to the
+        tabulated wave form, None if unknown.
+    """
+
+    # spec entries that do not change the wave form, not content hashed
+    METADATA = ('error',)
+
+    def __init__(self, t, values, kind: str = 'cubic',
+                 error: float = None) -> None:
+        """Set the samples and build the piecewise polynomial.
+
+        Arguments
+        ----------
+        t : array_like with shape (n,)
+            The increasing sampling time, n is at least 2.
+        values : array_like with shape (n,)
+            The value at each sampling time.
+        kind : str, optional
+            The interpolation, 'linear' or 'cubic'. (default is 'cubic')
+        error : float, optional
+            The estimated maximal absolute error of the interpolation.
+            (default is None)
+        """
+        t = np.array(t, dtype=float)
+        values = np.array(values, dtype=float)
+        if t.ndim != 1 or len(t) < 2 or t.shape != values.shape:
+            raise ValueError(
+                'The t and values should be 1d arrays with the same length '
+                + 'of at least 2.') from None
+        if np.any(np.diff(t) <= 0):
+            raise ValueError('The t should be increasing.') from None
+        if kind not in INTERPOLATION_KINDS:
+            raise ValueError(
+                f'The kind {kind} is not one of {INTERPOLATION_KINDS}.'
+                ) from None
+        self.t = t
+        self.values = values
+        self.kind = kind
+        self.error = error
+        # polynomial coefficients in (t - t[i]) of each interval, the
+        # highest power first, as python floats for fast scalar calls
+        if kind == 'linear':
+            coef = np.array([np.diff(values) / np.diff(t), values[:-1]])
+        else: # is cubic
+            coef = CubicSpline(t, values).c
+        self._coef = coef
+        self._coef_list = coef.T.tolist()
+        self._t_list = t.tolist()
+        self._ends = (float(values[0]), float(values[-1]))
+
+    @property
+    def s(self) -> float:
+        """The duration of the table."""
+        return self._t_list[-1]
+
+    def __call__(self, t):
+        """Return the value at t, t can be an 1d numpy.array or float."""
+        if isinstance(t, np.ndarray):
+            tc = np.clip(t, 0., self.s)
+            index = np.clip(np.searchsorted(self.t, tc, side='right') - 1,
+                            0, len(self.t) - 2)
+            dx = tc - self.t[index]
+            result = self._coef[0, index]
+            for row in self._coef[1:]:
+                result = result * dx + row[index]
+            return result
+        else: # is a constant
+            t_list = self._t_list
+            if t <= 0:
+                return self._ends[0]
+            if t >= t_list[-1]:
+                return self._ends[1]
+            index = bisect.bisect_right(t_list, t) - 1
+            dx = t - t_list[index]
+            if self.kind == 'linear':
+                slope, value = self._coef_list[index]
+                return slope * dx + value
+            c3, c2, c1, c0 = self._coef_list[index]
+            return ((c3 * dx + c2) * dx + c1) * dx + c0
+
+    def to_spec(self) -> dict:
+        """Return the parameters that describe this wave form."""
+        return {'t': self.t, 'values': self.values, 'kind': self.kind,
+                'error': self.error}
+
+    @classmethod
+    def from_spec(cls, spec: dict) -> 'InterpolationTable':
+        """Create the wave form from the output of `to_spec`."""
+        return cls(**spec)
+
+    def __repr__(self):
+        return (f"A {self.kind} interpolation table with {len(self.t)} "
+                + f"samples in {self.s*1e+6:.2f} us")
+
+def _evaluate(waveform, t: np.ndarray) -> np.ndarray:
+    """Evaluate a wave form at an array of time."""
+    if type(waveform) in WAVEFORM_TYPES.values():
+        return np.asarray(waveform(t), dtype=float)
+    return np.array([waveform(ti) for ti in t], dtype=float)
+
+def tabulate(waveform, s: float, tol: float = 1e-6,
+             kind: str = 'cubic',
+             *,
+             initial_points: int = 33,
+             max_points: int = 2**16) -> InterpolationTable:
+    """Tabulate a wave form on [0, s] by an adaptive grid.
+
+    Starting from an equally spaced grid, each interval whose midpoint
+    deviates from the interpolation by more than the tolerance is split
+    at the midpoint, until all intervals are within the tolerance. At a
+    step of the wave form, the error can not go below the tolerance, the
+    step is refined until its interval is s * 2**-24 short.
+
+    Arguments
+    ----------
+    waveform : callable(t)
+        The wave form, t is the time from the start of the section.
+    s : float
+        The duration to be tabulated.
+    tol : float, optional
+        The tolerance of the error, relative to the maximal magnitude of
+        the wave form on the initial grid. (default is 1e-6)
+    kind : str, optional
+        The interpolation, 'linear' or 'cubic'. (default is 'cubic')
+
+    Keyword Arguments
+    ----------
+    initial_points : int, optional
+        The number of points of the initial grid. (default is 33)
+    max_points : int, optional
+        Stop refining when the grid has more points. (default is 65536)
+
+    Returns
+    ----------
+    table : InterpolationTable
+        The table, table.error is the maximal error at the midpoints of
+        the final grid.
+    """
+    if kind not in INTERPOLATION_KINDS:
+        raise ValueError(
+            f'The kind {kind} is not one of {INTERPOLATION_KINDS}.') from None
+    if not s > 0:
+        raise ValueError(f'The duration {s} is not positive.') from None
+    t = np.linspace(0, s, max(initial_points, 2))
+    values = _evaluate(waveform, t)
+    scale = np.abs(values).max()
+    atol = tol * (scale if scale > 0 else 1.)
+    min_step = s * 2.**-24
+    while True:
+        table = InterpolationTable(t, values, kind)
+        t_mid = (t[:-1] + t[1:]) / 2
+        values_mid = _evaluate(waveform, t_mid)
+        error = np.abs(values_mid - table(t_mid))
+        split = (error > atol) & (np.diff(t) > min_step)
+        if not split.any() or len(t) + split.sum() > max_points:
+            break
+        order = np.argsort(np.concatenate([t, t_mid[split]]), kind='stable')
+        t = np.concatenate([t, t_mid[split]])[order]
+        values = np.concatenate([values, values_mid[split]])[order]
+    table.error = float(error.max())
+    return table
+
+# the wave forms that can be described by spec, see module `serialize`
+WAVEFORM_TYPES = {
+    'gaussian_padded_pulse': GaussianPaddedPulse,
+    'piecewise_constant': PiecewiseConstant,
+    'interpolation_table': InterpolationTable,
+}
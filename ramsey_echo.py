@@ -1,3 +1,4 @@
+import os
 import blochsimu as bs
 from matplotlib import pyplot as plt
 import numpy as np
@@ -25,6 +26,11 @@ option = (
     'Echo time domain'    # 3
 )[3]
 dt = 1e-7 # sampling time for numerical integral
+# reuse solutions of previous runs, opt in by setting BLOCHSIMU_CACHE to
+# a directory, e.g. BLOCHSIMU_CACHE=.blochsimu_cache
+cache = None
+if os.environ.get('BLOCHSIMU_CACHE'):
+    cache = bs.ResultCache(os.environ['BLOCHSIMU_CACHE'])
 if option == 'Ramesy once':
     tau = 30e-6
     delta = 0.1e+6
@@ -34,21 +40,20 @@ if option == 'Ramesy once':
         bs.Section(s=tau, d = delta),
         bs.Section(s=2.2e-6, I=7e+5, d = delta),
     )
-    u_sol, u_sol_section = bs.blochsolve(expe, dt)
+    u_sol, u_sol_section = bs.blochsolve(expe, dt, cache=cache)
     bs.blochdrawer.plot(u_sol, block=True)
 if option == 'Ramesy time domain':
     taus = np.linspace(1e-6, 400e-6, 201)
     delta = 0.1e+6
-    z_end = []
-    for tau in taus:
+    def scheme_of(tau):
         expe = bs.ExpScheme(**phy_args)
         expe.sequence = (
             bs.Section(s=2.2e-6, I=7e+5, d = delta),
             bs.Section(s=tau, d = delta),
             bs.Section(s=2.2e-6, I=7e+5, d = delta),
         )
-        u_sol, u_sol_section = bs.blochsolve(expe, dt)
-        z_end.append(u_sol[3, -1])
+        return expe
+    z_end = bs.sweep(scheme_of, taus, dt, cache=cache)[:, 2]
 
     plt.figure()
     plt.plot(taus*1e+6, z_end, 'k .')
@@ -68,13 +73,12 @@ if option == 'Echo once':
         bs.Section(s=tau/2, d = delta),
         bs.Section(s=2.2e-6, I=7e+5, d = delta),
     )
-    u_sol, u_sol_section = bs.blochsolve(expe, dt)
+    u_sol, u_sol_section = bs.blochsolve(expe, dt, cache=cache)
     bs.blochdrawer.plot(u_sol, block=True)
 if option == 'Echo time domain':
     taus = np.linspace(1e-6, 400e-6, 201)
     delta = 0
-    z_end = []
-    for tau in taus:
+    def scheme_of(tau):
         expe = bs.ExpScheme(**phy_args)
         expe.sequence = (
             bs.Section(s=2.2e-6, I=7e+5, d = delta),
@@ -83,8 +87,8 @@ if option == 'Echo time domain':
             bs.Section(s=tau/2, d = delta),
             bs.Section(s=2.2e-6, I=7e+5, d = delta),
         )
-        u_sol, u_sol_section = bs.blochsolve(expe, dt)
-        z_end.append(u_sol[3, -1])
+        return expe
+    z_end = bs.sweep(scheme_of, taus, dt, cache=cache)[:, 2]
 
     plt.figure()
     plt.plot(taus*1e+6, z_end, 'k .')
@@ -82,3 +82,321 @@ if option == 'time domain':
     plt.legend()
     plt.show()
 
+
+
+# consistency checks, run on every option
+import pickle
+
+# a precompiled scheme with callable defaults can be serialized and pickled
+expe = bs.ExpScheme(**{**phy_args, 'd': lambda t: 1e+5 * np.cos(1e+5 * t)})
+expe.sequence = (
+    bs.Section(s=20e-6, I=lambda t: 3e+5 * np.sin(2e+5 * t)),
+    bs.Section(s=10e-6),
+)
+expe.precompile()
+u_end = bs.blochsolve(expe, dt)[0][1:4, -1]
+for copy in (bs.serialize.loads(bs.serialize.dumps(expe)),
+             pickle.loads(pickle.dumps(expe))):
+    assert np.allclose(bs.blochsolve(copy, dt)[0][1:4, -1], u_end, atol=1e-9)
+
+# the grape gradient agrees with finite differences
+pulse = bs.PiecewiseConstant(2e+5 * np.sin(np.linspace(0, 3, 8)), 20e-6)
+expe = bs.ExpScheme(**phy_args)
+expe.sequence = (bs.Section(s=20e-6, I=pulse, d=3e+4),)
+value, gradients = bs.grape_gradient(expe, (0, 1, 0))
+step = 1.
+for k in range(len(pulse.samples)):
+    pulse.samples[k] += step
+    value_plus, _ = bs.grape_gradient(expe, (0, 1, 0))
+    pulse.samples[k] -= 2 * step
+    value_minus, _ = bs.grape_gradient(expe, (0, 1, 0))
+    pulse.samples[k] += step
+    assert np.isclose(gradients[pulse][k], (value_plus - value_minus) / 2 / step,
+                      rtol=1e-5, atol=1e-12)
+
+# the fit jacobian agrees with finite differences
+from blochsimu import fitting
+def ramsey(tau):
+    expe = bs.ExpScheme(**phy_args)
+    expe.sequence = (
+        bs.Section(s=2.2e-6, I=7e+5),
+        bs.Section(s=tau, d=d),
+        bs.Section(s=2.2e-6, I=7e+5),
+    )
+    return expe
+stacked = fitting._compile_template(ramsey, np.linspace(1e-6, 40e-6, 5))
+params = {'G1': G1, 'G2': G2, 'd': d, 'scale': 1.1}
+observable = np.array(fitting.OBSERVABLES['z'], dtype=float)
+fit = tuple(params)
+_, jac = fitting._model(stacked, params, observable, fit, True)
+for k, name in enumerate(fit):
+    step = 1e-6 * params[name]
+    y_plus, _ = fitting._model(
+        stacked, {**params, name: params[name] + step}, observable, fit)
+    y_minus, _ = fitting._model(
+        stacked, {**params, name: params[name] - step}, observable, fit)
+    assert np.allclose(jac[:, k], (y_plus - y_minus) / 2 / step,
+                       rtol=1e-5, atol=1e-6 * np.abs(jac[:, k]).max())
+
+# a compiled scheme of repeated blocks agrees with blochsolve
+shaped = lambda t: 5e+5 * np.sin(1e+6 * t)
+expe = bs.ExpScheme(**phy_args)
+expe.sequence = [section for _ in range(6) for section in (
+    bs.Section(s=2.2e-6, Q=7e+5),
+    bs.Section(s=2e-6, d=d),
+    bs.Section(s=3e-6, I=shaped),
+)]
+compiled = expe.compile()
+assert compiled.stats['unique_sections'] == 3
+assert np.allclose(compiled.final_state(), bs.blochsolve(expe, dt)[0][1:4, -1],
+                   atol=1e-6)
+
+# randomized benchmarking without decay and detune always survives
+expe = bs.ExpScheme(**{**phy_args, 'G1': 0, 'G2': 0})
+rb = bs.CliffordRB(expe, amplitude=2*np.pi*10e+6)
+survival = rb.survival([1, 5, 20], n_seq=10, seed=1234)
+assert np.allclose(survival, 1, atol=1e-9)
+
+# the global grid agrees with the section grid, also for sections shorter
+# than dt
+expe = bs.ExpScheme(**phy_args)
+expe.sequence = [section for _ in range(20) for section in (
+    bs.Section(s=0.2e-6, I=8e+6),
+    bs.Section(s=3e-6, Q=shaped, d=d),
+    bs.Section(s=0.),
+    bs.Section(s=5e-6),
+)]
+u_section = bs.blochsolve(expe, dt)[0]
+u_global = bs.blochsolve(expe, dt, grid='global')[0]
+assert np.isclose(u_global[0, -1], expe.total_time)
+assert np.allclose(u_global[1:4, -1], u_section[1:4, -1], atol=1e-6)
+
+# choosing the method by stiffness agrees with odeint, e.g. with a reset
+expe = bs.ExpScheme(**phy_args)
+expe.sequence = (
+    bs.Section(s=3e-6, I=shaped),
+    bs.Section(s=20e-6, Q=shaped, G1=2e+8, G2=2e+8),
+    bs.Section(s=5e-6, I=7e+5, d=d),
+)
+u_odeint = bs.blochsolve(expe, dt)[0]
+u_auto, _, info = bs.blochsolve(expe, dt, method='auto', full_output=True)
+assert info['method'] == ['odeint', 'odeint-jacobian', 'exact']
+assert np.allclose(u_auto, u_odeint, atol=1e-6)
+
+# the result cache counts hits and misses, returns the stored solution and
+# evicts the least recently used entries over its cap
+import tempfile
+with tempfile.TemporaryDirectory() as directory:
+    cache = bs.ResultCache(directory)
+    expe = bs.ExpScheme(**phy_args)
+    expe.sequence = (bs.Section(s=20e-6, I=7e+5, d=d),)
+    u_sol = bs.blochsolve(expe, dt, cache=cache)[0]
+    u_cached = bs.blochsolve(expe, dt, cache=cache)[0]
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert np.array_equal(u_cached, bs.blochsolve(expe, dt)[0])
+    cache = bs.ResultCache(directory, max_bytes=1)
+    for k in range(3):
+        cache.put(cache.key(k=k), {'u': np.arange(100.) + k})
+    assert cache.stats()['entries'] == 1
+    assert np.array_equal(cache.get(cache.key(k=2))['u'], np.arange(100.) + 2)
+    assert cache.get(cache.key(k=0)) is None
+
+# the rotating frame with the counter-rotating term kept exactly agrees with
+# the lab frame, where the drive (Q, I) = 2(Q cos wc t - I sin wc t, 0) and
+# the detune is d + wc
+carrier = 2e+8
+drive = {'I': 6e+6, 'Q': 4e+6}
+expe = bs.ExpScheme(**phy_args, carrier=carrier, counter_rotating='exact')
+expe.sequence = (bs.Section(s=2e-6, d=d, **drive),)
+u_lab = bs.to_lab_frame(bs.blochsolve(expe, 1e-8)[0], carrier)
+expe = bs.ExpScheme(**phy_args)
+expe.sequence = (bs.Section(
+    s=2e-6, d=d + carrier, I=0,
+    Q=lambda t: 2 * (drive['Q'] * np.cos(carrier * t)
+                     - drive['I'] * np.sin(carrier * t))),)
+assert np.allclose(bs.blochsolve(expe, 1e-8)[0], u_lab, atol=1e-5)
+# the Bloch-Siegert shift adds (I^2 + Q^2) / (2(d + 2wc)) to the detune
+expe = bs.ExpScheme(**phy_args, carrier=carrier,
+                    counter_rotating='bloch-siegert')
+expe.sequence = (bs.Section(s=2e-6, d=d, **drive),)
+shift = (drive['I']**2 + drive['Q']**2) / (2 * (d + 2 * carrier))
+expe_shifted = bs.ExpScheme(**phy_args)
+expe_shifted.sequence = (bs.Section(s=2e-6, d=d + shift, **drive),)
+assert np.allclose(bs.blochsolve(expe, dt)[0],
+                   bs.blochsolve(expe_shifted, dt)[0], atol=1e-9)
+
+# the batched exact propagators agree with blochsolve of each point, and
+# the batched expm agrees with scipy on bloch generators
+import scipy.linalg
+from blochsimu import propagator
+def rabi(detune, s):
+    expe = bs.ExpScheme(**phy_args)
+    expe.sequence = (bs.Section(s=s, I=7e+5, d=detune), bs.Section(s=5e-6))
+    return expe
+detunes = np.linspace(-1e+6, 1e+6, 3)
+durations = np.linspace(1e-6, 10e-6, 4)
+u_points = np.array([[bs.blochsolve(rabi(detune, s), dt)[0][1:4, -1]
+                      for s in durations] for detune in detunes])
+assert np.allclose(bs.map_sweep(rabi, detunes, durations, dt), u_points,
+                   atol=1e-6)
+assert np.allclose(bs.final_states(rabi(detune, durations[0])
+                                   for detune in detunes),
+                   u_points[:, 0], atol=1e-6)
+I, Q, d_random, z0, G1_random, G2_random = (
+    np.random.default_rng(1234).normal(0, 1e+6, (6, 20)))
+generators = propagator.bloch_generator(
+    I, Q, d_random, z0 / 1e+6, abs(G1_random), abs(G2_random)) * 1e-5
+assert np.allclose(propagator.expm(generators),
+                   [scipy.linalg.expm(A) for A in generators],
+                   rtol=1e-12, atol=1e-12)
+
+# AsyncSolver times out, sets the cancel event of the job and frees its slot
+# once the job stops, also when the waiting task is cancelled
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+events = []
+def wait_cancelled(cancel=None):
+    events.append(cancel)
+    return cancel.wait(10)
+def ignore_cancel(cancel=None):
+    time.sleep(0.3)
+async def check_async_solver():
+    solver = bs.AsyncSolver(ThreadPoolExecutor(4), max_concurrency=1)
+    try:
+        await solver._run(wait_cancelled, timeout=0.05)
+        raise AssertionError('no timeout')
+    except asyncio.TimeoutError:
+        pass
+    assert events[-1].is_set()
+    task = asyncio.ensure_future(solver._run(wait_cancelled))
+    await asyncio.sleep(0.05)
+    task.cancel()
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
+    assert events[-1].is_set()
+    # a timed out job that keeps running holds the only slot
+    try:
+        await solver._run(ignore_cancel, timeout=0.05)
+        raise AssertionError('no timeout')
+    except asyncio.TimeoutError:
+        pass
+    try:
+        await asyncio.wait_for(solver._run(lambda cancel=None: 1), 0.1)
+        raise AssertionError('the slot is not held')
+    except asyncio.TimeoutError:
+        pass
+    # with one slot, this only runs when the cancelled jobs have stopped
+    expe = bs.ExpScheme(**phy_args)
+    expe.sequence = (bs.Section(s=20e-6, I=7e+5),)
+    u_sol = (await solver.blochsolve(expe, dt, timeout=5))[0]
+    assert np.allclose(u_sol, bs.blochsolve(expe, dt)[0])
+asyncio.run(check_async_solver())
+
+# readout streams are reproducible, and the shot frequencies match the
+# measurement probability within binomial tolerance
+from blochsimu import readout
+streams = [readout.rng_streams(1234, 3) for _ in range(2)]
+assert all(np.array_equal(a.random(5), b.random(5)) for a, b in zip(*streams))
+u = np.array([[0, 0, 1], [1, 0, 0], [0.3, 0.4, -0.8], [0, 0, -1]])
+assignment = np.array([[0.97, 0.03], [0.08, 0.92]])
+p1 = bs.measurement_probability(u, assignment=assignment, prep_error=0.01)
+shots = 200000
+counts = bs.sample_shots(u, shots, assignment=assignment, prep_error=0.01,
+                         seed=1234, workers=2, chunk_size=1)
+assert np.all(np.abs(counts / shots - p1)
+              <= 5 * np.sqrt(p1 * (1 - p1) / shots))
+assert np.array_equal(counts, bs.sample_shots(
+    u, shots, assignment=assignment, prep_error=0.01, seed=1234,
+    chunk_size=1))
+
+# a command-line job writes result.npz, and a rerun resumes from the saved
+# chunks instead of solving them again
+import json
+import os
+from blochsimu import cli
+with tempfile.TemporaryDirectory() as directory:
+    job_path = os.path.join(directory, 'job.json')
+    with open(job_path, 'w') as f:
+        json.dump({
+            'dt': dt, 'chunk_size': 2,
+            'scheme': {'u0': [0, 0, 1],
+                       'defaults': {'z0': 1, 'I': 0, 'Q': 0, 'd': d,
+                                    'G1': G1, 'G2': G2},
+                       'sequence': [{'s': 2.2e-6, 'phy_args': {'I': 7e+5}},
+                                    {'s': '$tau'}]},
+            'sweep': {'tau': [1e-6, 2e-6, 3e-6]}}, f)
+    output = os.path.join(directory, 'out')
+    u_end = cli.run_job(cli.load_job(job_path), output, progress=False)
+    with np.load(os.path.join(output, 'result.npz')) as result:
+        assert np.array_equal(result['u_end'], u_end)
+        assert np.array_equal(result['tau'], [1e-6, 2e-6, 3e-6])
+    chunk = os.path.join(output, 'chunk_000000.npy')
+    np.save(chunk, np.zeros((2, 3)))
+    u_resumed = cli.run_job(cli.load_job(job_path), output, progress=False)
+    assert np.array_equal(u_resumed[:2], np.zeros((2, 3)))
+    assert np.array_equal(u_resumed[2], u_end[2])
+
+# module render draws on plain figures, pyplot is not touched: its figure
+# and axes factories fail while rendering and it manages no new figure
+import io
+import matplotlib.figure
+from blochsimu import render
+plt.close('all')
+factories = {name: getattr(plt, name)
+             for name in ('figure', 'gcf', 'gca', 'subplots', 'axes')}
+def no_pyplot(*args, **kwargs):
+    raise AssertionError('pyplot is used')
+for name in factories:
+    setattr(plt, name, no_pyplot)
+try:
+    expe = bs.ExpScheme(**phy_args)
+    expe.sequence = (bs.Section(s=10e-6, I=shaped), bs.Section(s=5e-6))
+    fig, ax = render.plot_trajectory(bs.blochsolve(expe, dt)[0], sepe_N=5)
+    assert type(fig) is matplotlib.figure.Figure
+    fig.savefig(io.BytesIO(), format='png')
+    fig = matplotlib.figure.Figure()
+    render.plot_phy_arg(expe, 'I', dt, ax=fig.add_subplot(111))
+    fig.savefig(io.BytesIO(), format='png')
+finally:
+    for name, factory in factories.items():
+        setattr(plt, name, factory)
+assert plt.get_fignums() == []
+
+# a compiled scheme follows in-place changes of the pulse samples
+pulse = bs.PiecewiseConstant(np.full(4, 3e+5), 4e-6)
+expe = bs.ExpScheme(**phy_args)
+expe.sequence = [bs.Section(s=4e-6, I=pulse), bs.Section(s=2e-6)] * 3
+compiled = expe.compile()
+compiled.final_state()
+pulse.samples *= 2
+assert np.allclose(compiled.final_state(), bs.blochsolve(expe, dt)[0][1:4, -1],
+                   atol=1e-6)
+
+# the content hash ignores the error estimate of interpolation tables
+schemes = []
+for peak, error in ((3e+5, None), (3e+5, 1e-7), (3e+5 + 1, None)):
+    expe = bs.ExpScheme(**phy_args)
+    expe.sequence = (bs.Section(s=4e-6, I=bs.InterpolationTable(
+        [0, 2e-6, 4e-6], [0, peak, 0], kind='linear', error=error)),)
+    schemes.append(expe)
+hashes = [bs.content_hash(expe) for expe in schemes]
+assert hashes[0] == hashes[1] != hashes[2]
+
+# fitting rejects the Bloch-Siegert shift, which depends on the fit
+def ramsey_shifted(tau):
+    expe = bs.ExpScheme(**phy_args, carrier=2e+8,
+                        counter_rotating='bloch-siegert')
+    expe.sequence = (
+        bs.Section(s=2.2e-6, I=7e+5),
+        bs.Section(s=tau, d=d),
+        bs.Section(s=2.2e-6, I=7e+5),
+    )
+    return expe
+try:
+    bs.fit_bloch(ramsey_shifted, [1e-6, 2e-6], [0, 0], {'d': d})
+    raise AssertionError('bloch-siegert is fitted')
+except ValueError:
+    pass